@@ -0,0 +1,15 @@
+import pytest
+
+
+# the unit tests don't need the geth node and the bundler of the parent
+# conftest, its autouse fixtures are overridden with no-ops
+
+
+@pytest.fixture(scope="module", autouse=True)
+def gethDockerContainer():
+    yield
+
+
+@pytest.fixture(scope="module", autouse=True)
+def bundlerInstance():
+    yield
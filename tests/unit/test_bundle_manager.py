@@ -0,0 +1,251 @@
+import asyncio
+import json
+
+import pytest
+import pytest_asyncio
+import rlp
+from aiohttp import web
+
+from voltaire_bundler.bundler.bundle.bundle_manager import BundlerManager
+from voltaire_bundler.bundler.reputation_manager import ReputationManager
+from voltaire_bundler.user_operation.user_operation import UserOperation
+from voltaire_bundler.utils.eth_client_utils import close_client_session
+
+ENTRYPOINT = "0x5FF137D4b0FDCD49DcA30c7CF57E578a026d2789"
+BUNDLER_PRIVATE_KEY = "0x" + "11" * 32
+BUNDLER_ADDRESS = "0x19E7E376E7C213B7E7e7e46cc70A5dD086DAff2A"
+PENDING_NONCE = 5
+
+
+class EthNode:
+    """
+    json-rpc node for the bundle rpc calls, the eth_sendRawTransaction reply
+    is set by the tests
+    """
+
+    def __init__(self):
+        self.methods = []
+        self.sent_nonces = []
+        self.send_error = None
+        self.is_send_failing = False
+
+    async def handle(self, request):
+        body = json.loads(await request.read())
+        if isinstance(body, list):
+            return web.json_response(
+                [self.reply(json_request) for json_request in body])
+        if body["method"] == "eth_sendRawTransaction" and self.is_send_failing:
+            return web.Response(text="not json")
+        return web.json_response(self.reply(body))
+
+    def reply(self, json_request):
+        method = json_request["method"]
+        self.methods.append(method)
+        response = {"jsonrpc": "2.0", "id": json_request["id"]}
+        if method == "eth_getTransactionCount":
+            response["result"] = hex(PENDING_NONCE)
+        elif method == "eth_sendRawTransaction":
+            raw_transaction = bytes.fromhex(json_request["params"][0][2:])
+            # eip-1559 transaction: 0x02 || rlp([chainId, nonce, ...])
+            nonce = rlp.decode(raw_transaction[1:])[1]
+            self.sent_nonces.append(int.from_bytes(nonce, "big"))
+            if self.send_error is not None:
+                response["error"] = self.send_error
+            else:
+                response["result"] = "0x" + "aa" * 32
+        else:  # eth_gasPrice and eth_maxPriorityFeePerGas
+            response["result"] = "0x10"
+        return response
+
+    @property
+    def number_of_nonce_fetches(self):
+        return self.methods.count("eth_getTransactionCount")
+
+
+def make_user_operation(index: int) -> UserOperation:
+    return UserOperation(
+        {
+            "sender": "0x" + f"{index + 1:040x}",
+            "nonce": hex(index),
+            "initCode": "0x",
+            "callData": "0x",
+            "callGasLimit": hex(100_000),
+            "verificationGasLimit": hex(100_000),
+            "preVerificationGas": hex(21_000),
+            "maxFeePerGas": hex(10),
+            "maxPriorityFeePerGas": hex(1),
+            "paymasterAndData": "0x",
+            "signature": "0x" + "12" * 65,
+        }
+    )
+
+
+@pytest_asyncio.fixture
+async def eth_node():
+    node = EthNode()
+    app = web.Application()
+    app.router.add_post("/", node.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    node.url = f"http://127.0.0.1:{port}/"
+    yield node
+    await close_client_session()
+    await runner.cleanup()
+
+
+@pytest_asyncio.fixture
+async def bundle_manager(eth_node):
+    return BundlerManager(
+        {ENTRYPOINT: None},
+        None,
+        ReputationManager(),
+        None,
+        eth_node.url,
+        BUNDLER_PRIVATE_KEY,
+        BUNDLER_ADDRESS,
+        1337,
+        False,
+        False,
+        100,
+        100,
+        10,
+    )
+
+
+@pytest.mark.asyncio
+async def test_nonce_is_fetched_once_then_incremented(eth_node, bundle_manager):
+    """
+    Test the nonce is only fetched for the first bundle
+    """
+    for index in range(3):
+        assert await bundle_manager.send_bundle(
+            [make_user_operation(index)], ENTRYPOINT) == []
+
+    assert eth_node.sent_nonces == [5, 6, 7]
+    assert eth_node.number_of_nonce_fetches == 1
+    assert bundle_manager.bundler_nonce == 8
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "message",
+    [
+        "already known",
+        "nonce too low",
+        "transaction underpriced",
+        "replacement transaction underpriced",
+        "unknown error",
+    ],
+)
+async def test_nonce_is_fetched_again_after_send_error(
+    eth_node, bundle_manager, message
+):
+    """
+    Test the nonce is fetched again after a failed bundle
+    """
+    await bundle_manager.send_bundle([make_user_operation(0)], ENTRYPOINT)
+    eth_node.send_error = {"code": -32000, "message": message}
+    await bundle_manager.send_bundle([make_user_operation(1)], ENTRYPOINT)
+
+    assert bundle_manager.bundler_nonce is None
+
+    eth_node.send_error = None
+    await bundle_manager.send_bundle([make_user_operation(2)], ENTRYPOINT)
+
+    assert eth_node.sent_nonces == [5, 6, 5]
+    assert eth_node.number_of_nonce_fetches == 2
+
+
+@pytest.mark.asyncio
+async def test_nonce_is_fetched_again_after_send_failure(
+    eth_node, bundle_manager
+):
+    """
+    Test the nonce is fetched again when sending the bundle raises
+    """
+    await bundle_manager.send_bundle([make_user_operation(0)], ENTRYPOINT)
+    eth_node.is_send_failing = True
+    with pytest.raises(ValueError):
+        await bundle_manager.send_bundle([make_user_operation(1)], ENTRYPOINT)
+
+    assert bundle_manager.bundler_nonce is None
+
+    eth_node.is_send_failing = False
+    await bundle_manager.send_bundle([make_user_operation(2)], ENTRYPOINT)
+
+    assert eth_node.number_of_nonce_fetches == 2
+    assert eth_node.sent_nonces[-1] == 5
+
+
+@pytest.mark.asyncio
+async def test_user_operations_are_put_back_when_sending_raises(bundle_manager):
+    """
+    Test a failed bundle puts its user operations back in front of the
+    ones queued while it was in flight
+    """
+    user_operations = [make_user_operation(index) for index in range(3)]
+    send_queue = bundle_manager.entrypoints_addresses_to_send_queue
+    send_queue[ENTRYPOINT] = user_operations[:2]
+
+    async def send_bundle(user_operations, entrypoint):
+        send_queue[entrypoint].append(user_operations_queued_meanwhile)
+        raise ValueError("send failed")
+
+    user_operations_queued_meanwhile = user_operations[2]
+    bundle_manager.send_bundle = send_bundle
+    with pytest.raises(ValueError):
+        await bundle_manager.send_queued_bundles()
+
+    assert send_queue[ENTRYPOINT] == user_operations
+
+
+@pytest.mark.asyncio
+async def test_next_bundle_is_sent_after_a_failed_bundle(eth_node, bundle_manager):
+    """
+    Test a failed in flight bundle doesn't prevent sending the next one,
+    which retries its user operations
+    """
+    send_queue = bundle_manager.entrypoints_addresses_to_send_queue
+    send_queue[ENTRYPOINT] = [make_user_operation(0)]
+    eth_node.is_send_failing = True
+    failed_bundle_task = await bundle_manager.send_next_bundle()
+    with pytest.raises(ValueError):
+        await failed_bundle_task
+
+    eth_node.is_send_failing = False
+    bundle_task = await bundle_manager.send_next_bundle()
+    await bundle_task
+
+    assert bundle_task is not failed_bundle_task
+    assert send_queue[ENTRYPOINT] == []
+    assert eth_node.sent_nonces == [5]
+    assert eth_node.number_of_nonce_fetches == 2
+
+
+@pytest.mark.asyncio
+async def test_concurrent_bundles_are_sent_one_after_another(
+    eth_node, bundle_manager
+):
+    """
+    Test the bundles scheduled concurrently are all awaited and sent in
+    order
+    """
+    send_queue = bundle_manager.entrypoints_addresses_to_send_queue
+    send_queue[ENTRYPOINT] = [make_user_operation(0)]
+    first_bundle_task = await bundle_manager.send_next_bundle()
+    await asyncio.sleep(0)  # the first bundle takes its user operations
+    send_queue[ENTRYPOINT].append(make_user_operation(1))
+
+    second_bundle_task, third_bundle_task = await asyncio.gather(
+        bundle_manager.send_next_bundle(), bundle_manager.send_next_bundle()
+    )
+    await second_bundle_task
+    await third_bundle_task
+
+    assert first_bundle_task.done()
+    assert eth_node.sent_nonces == [5, 6]
+    await bundle_manager.wait_for_inflight_bundle()
+    assert bundle_manager.inflight_bundle_task is None
@@ -0,0 +1,107 @@
+import pytest
+from eth_abi import encode
+
+from voltaire_bundler.user_operation.user_operation import UserOperation
+from voltaire_bundler.utils.encode import (
+    encode_addresses, encode_handleops_calldata,
+    encode_handleops_calldata_from_encoded_user_operations,
+    encode_simulate_validation_calldata, encode_user_operation)
+
+USER_OPERATION_TYPE = (
+    "(address,uint256,bytes,bytes,uint256,uint256,uint256,uint256,uint256,"
+    "bytes,bytes)"
+)
+BENEFICIARY = "0x" + "be" * 20
+
+
+def user_operation_dict(index: int) -> dict[str, str]:
+    # the bytes fields have odd and multiple of 32 lengths
+    return {
+        "sender": "0x" + f"{index + 1:040x}",
+        "nonce": hex(index),
+        "initCode": "0x" + "ab" * (20 + 13 * index),
+        "callData": "0x" + "cd" * (32 * index + 1),
+        "callGasLimit": hex(100_000 + index),
+        "verificationGasLimit": hex(2**128 + index),
+        "preVerificationGas": hex(21_000),
+        "maxFeePerGas": hex(2**256 - 1),
+        "maxPriorityFeePerGas": "0x",
+        "paymasterAndData": "0x" if index % 2 == 0 else "0x" + "ef" * 53,
+        "signature": "0x" + "12" * 65,
+    }
+
+
+def make_user_operations(number_of_user_operations: int) -> list[UserOperation]:
+    return [
+        UserOperation(user_operation_dict(index))
+        for index in range(number_of_user_operations)
+    ]
+
+
+@pytest.mark.parametrize("number_of_user_operations", [0, 1, 2, 5])
+def test_encode_handleops_calldata(number_of_user_operations):
+    """
+    Test the handleOps calldata is the same as the eth_abi encoding
+    """
+    user_operations_list = [
+        user_operation.to_list()
+        for user_operation in make_user_operations(number_of_user_operations)
+    ]
+    expected_call_data = bytes.fromhex("1fad948c") + encode(
+        [USER_OPERATION_TYPE + "[]", "address"],
+        [user_operations_list, BENEFICIARY],
+    )
+
+    assert (
+        encode_handleops_calldata(user_operations_list, BENEFICIARY)
+        == expected_call_data
+    )
+    assert (
+        encode_handleops_calldata_from_encoded_user_operations(
+            [
+                encode_user_operation(user_operation)
+                for user_operation in user_operations_list
+            ],
+            BENEFICIARY,
+        )
+        == expected_call_data
+    )
+
+
+@pytest.mark.parametrize("number_of_user_operations", [1, 2, 3])
+def test_encode_simulate_validation_calldata(number_of_user_operations):
+    """
+    Test the simulateValidation calldata is the same as the eth_abi encoding
+    """
+    for user_operation in make_user_operations(number_of_user_operations):
+        expected_call_data = "0xee219423" + encode(
+            [USER_OPERATION_TYPE], [user_operation.to_list()]
+        ).hex()
+
+        assert encode_simulate_validation_calldata(user_operation) == (
+            expected_call_data)
+
+
+def test_encode_simulate_validation_calldata_cache_is_cleared():
+    """
+    Test the cached simulateValidation calldata follows the updated fields
+    """
+    user_operation = make_user_operations(2)[1]
+    encode_simulate_validation_calldata(user_operation)
+    user_operation.call_gas_limit = 7
+    user_operation.signature = bytes(3)
+
+    assert encode_simulate_validation_calldata(user_operation) == (
+        "0xee219423"
+        + encode([USER_OPERATION_TYPE], [user_operation.to_list()]).hex()
+    )
+
+
+@pytest.mark.parametrize("number_of_addresses", [0, 1, 3])
+def test_encode_addresses(number_of_addresses):
+    """
+    Test the address[] encoding is the same as the eth_abi encoding
+    """
+    addresses = ["0x" + f"{index + 1:040x}" for index in range(number_of_addresses)]
+
+    assert encode_addresses(addresses) == encode(["address[]"], [addresses])
@@ -0,0 +1,161 @@
+import asyncio
+import json
+
+import pytest
+import pytest_asyncio
+from aiohttp import web
+
+from voltaire_bundler.utils.eth_client_utils import (
+    BatchingRpcClient, close_client_session,
+    send_rpc_batch_request_to_eth_client)
+
+
+class RpcServer:
+    """
+    json-rpc server replying with the method and params of every request,
+    batch responses are sent in the reverse order of the requests
+    """
+
+    def __init__(self):
+        self.requests_bodies = []
+        self.is_batch_supported = True
+        self.is_invalid_response = False
+
+    async def handle(self, request):
+        body = json.loads(await request.read())
+        self.requests_bodies.append(body)
+        if self.is_invalid_response:
+            return web.Response(text="not json")
+        if not isinstance(body, list):
+            return web.json_response(self.reply(body))
+        if not self.is_batch_supported:
+            return web.json_response(
+                {
+                    "jsonrpc": "2.0",
+                    "id": None,
+                    "error": {"code": -32600, "message": "batch not supported"},
+                }
+            )
+        return web.json_response(
+            [self.reply(json_request) for json_request in reversed(body)]
+        )
+
+    @staticmethod
+    def reply(json_request):
+        return {
+            "jsonrpc": "2.0",
+            "id": json_request["id"],
+            "result": [json_request["method"], json_request.get("params")],
+        }
+
+
+@pytest_asyncio.fixture
+async def rpc_server():
+    server = RpcServer()
+    app = web.Application()
+    app.router.add_post("/", server.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    server.url = f"http://127.0.0.1:{port}/"
+    yield server
+    await close_client_session()
+    await runner.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_batch_responses_are_returned_in_the_requests_order(rpc_server):
+    """
+    Test the out of order batch responses are matched to their request id
+    """
+    requests = [("eth_gasPrice", None), ("eth_blockNumber", None),
+                ("eth_getBalance", ["0x01", "latest"])]
+    responses = await send_rpc_batch_request_to_eth_client(
+        rpc_server.url, requests, 10)
+
+    assert [response["result"] for response in responses] == [
+        ["eth_gasPrice", None],
+        ["eth_blockNumber", None],
+        ["eth_getBalance", ["0x01", "latest"]],
+    ]
+    assert len(rpc_server.requests_bodies) == 1
+
+
+@pytest.mark.asyncio
+async def test_batch_requests_are_split_by_max_batch_size(rpc_server):
+    """
+    Test the requests are sent in batches of at most max_batch_size
+    """
+    requests = [("eth_blockNumber", [index]) for index in range(5)]
+    responses = await send_rpc_batch_request_to_eth_client(
+        rpc_server.url, requests, 2)
+
+    assert [response["result"][1] for response in responses] == [
+        [0], [1], [2], [3], [4]]
+    assert sorted(len(body) for body in rpc_server.requests_bodies) == [1, 2, 2]
+
+
+@pytest.mark.asyncio
+async def test_batch_falls_back_to_single_requests(rpc_server):
+    """
+    Test a non list reply to a batch sends the requests one by one
+    """
+    rpc_server.is_batch_supported = False
+    requests = [("eth_gasPrice", None), ("eth_blockNumber", None)]
+    responses = await send_rpc_batch_request_to_eth_client(
+        rpc_server.url, requests, 10)
+
+    assert [response["result"][0] for response in responses] == [
+        "eth_gasPrice", "eth_blockNumber"]
+    assert isinstance(rpc_server.requests_bodies[0], list)
+    assert all(
+        isinstance(body, dict) for body in rpc_server.requests_bodies[1:])
+    assert len(rpc_server.requests_bodies) == 3
+
+
+@pytest.mark.asyncio
+async def test_batching_client_coalesces_concurrent_requests(rpc_server):
+    """
+    Test the requests sent concurrently share a single batch
+    """
+    rpc_client = BatchingRpcClient(rpc_server.url, 10)
+    responses = await asyncio.gather(
+        *[rpc_client.send_rpc_request("eth_call", [index]) for index in range(3)]
+    )
+
+    assert [response["result"] for response in responses] == [
+        ["eth_call", [0]], ["eth_call", [1]], ["eth_call", [2]]]
+    assert len(rpc_server.requests_bodies) == 1
+    assert len(rpc_server.requests_bodies[0]) == 3
+
+
+@pytest.mark.asyncio
+async def test_batching_client_without_batching(rpc_server):
+    """
+    Test a max_batch_size of 1 sends every request on its own
+    """
+    rpc_client = BatchingRpcClient(rpc_server.url, 1)
+    responses = await asyncio.gather(
+        *[rpc_client.send_rpc_request("eth_call", [index]) for index in range(3)]
+    )
+
+    assert [response["result"][1] for response in responses] == [[0], [1], [2]]
+    assert all(isinstance(body, dict) for body in rpc_server.requests_bodies)
+
+
+@pytest.mark.asyncio
+async def test_batching_client_error_reaches_every_caller(rpc_server):
+    """
+    Test a failed batch raises the error to all of its callers
+    """
+    rpc_server.is_invalid_response = True
+    rpc_client = BatchingRpcClient(rpc_server.url, 10)
+    results = await asyncio.gather(
+        *[rpc_client.send_rpc_request("eth_call", [index]) for index in range(3)],
+        return_exceptions=True,
+    )
+
+    assert len(rpc_server.requests_bodies) == 1
+    assert all(isinstance(result, ValueError) for result in results)
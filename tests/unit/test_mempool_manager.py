@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+
+from voltaire_bundler.bundler.mempool.mempool_manager import (
+    LocalMempoolManagerVersion0Point6, gather_raising_in_order)
+from voltaire_bundler.bundler.mempool.sender_mempool import (
+    SenderMempool, VerifiedUserOperation)
+from voltaire_bundler.user_operation.user_operation import UserOperation
+
+
+class CodeHashes:
+    """
+    get_addresses_code_hash of the validation manager, the code hash is the
+    first associated address, or an error for the failing ones
+    """
+
+    def __init__(self, failing_addresses):
+        self.failing_addresses = failing_addresses
+
+    async def get_addresses_code_hash(self, addresses):
+        if addresses[0] in self.failing_addresses:
+            raise ValueError("eth_call failed")
+        return addresses[0]
+
+
+def make_user_operation(index: int, code_hash: str) -> UserOperation:
+    user_operation = UserOperation(
+        {
+            "sender": "0x" + f"{index + 1:040x}",
+            "nonce": "0x0",
+            "initCode": "0x",
+            "callData": "0x",
+            "callGasLimit": "0x1",
+            "verificationGasLimit": "0x1",
+            "preVerificationGas": "0x1",
+            "maxFeePerGas": "0x1",
+            "maxPriorityFeePerGas": "0x1",
+            "paymasterAndData": "0x",
+            "signature": "0x",
+        }
+    )
+    user_operation.associated_addresses = [f"address_{index}"]
+    user_operation.code_hash = code_hash
+    return user_operation
+
+
+def make_mempool_manager(user_operations, failing_addresses):
+    mempool_manager = LocalMempoolManagerVersion0Point6(
+        CodeHashes(failing_addresses),
+        None, None, None, "", "", "", "", 1337, False, 10, {},
+    )
+    for index, user_operation in enumerate(user_operations):
+        mempool_manager.senders_to_senders_mempools[
+            user_operation.sender_address
+        ] = SenderMempool(
+            user_operation.sender_address,
+            {f"hash_{index}": VerifiedUserOperation(user_operation, "")},
+        )
+    return mempool_manager
+
+
+@pytest.mark.asyncio
+async def test_failed_code_hash_fetch_keeps_the_user_operation():
+    """
+    Test a failed code hash fetch only keeps its own user operation in the
+    mempool and a changed code hash drops the user operation
+    """
+    user_operations = [
+        make_user_operation(0, "address_0"),
+        make_user_operation(1, "address_1"),
+        make_user_operation(2, "changed_code_hash"),
+    ]
+    mempool_manager = make_mempool_manager(user_operations, ["address_1"])
+
+    bundle = await mempool_manager.get_user_operations_to_bundle()
+
+    assert bundle == [user_operations[0]]
+    assert list(mempool_manager.senders_to_senders_mempools) == [
+        user_operations[1].sender_address,
+        user_operations[2].sender_address,
+    ]
+    senders_mempools = mempool_manager.senders_to_senders_mempools
+    assert list(
+        senders_mempools[user_operations[1].sender_address]
+        .user_operation_hashs_to_verified_user_operation
+    ) == ["hash_1"]
+    assert (
+        senders_mempools[user_operations[2].sender_address]
+        .user_operation_hashs_to_verified_user_operation == {}
+    )
+
+
+@pytest.mark.asyncio
+async def test_gather_raises_the_first_error_in_the_arguments_order():
+    """
+    Test the raised error doesn't depend on which awaitable fails first
+    """
+    async def check(delay, error):
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise ValueError(error)
+        return delay
+
+    with pytest.raises(ValueError, match="preverification gas"):
+        await gather_raising_in_order(
+            check(0, None),
+            check(0.01, "preverification gas"),
+            check(0, "gas fees"),
+        )
+
+    assert await gather_raising_in_order(check(0, None), check(0, None)) == [0, 0]
@@ -0,0 +1,160 @@
+import pytest
+from eth_utils import keccak
+
+from voltaire_bundler.bundler.exceptions import ValidationException
+from voltaire_bundler.bundler.validation_manager import (ASSOCIATED_SLOT_RANGE,
+                                                         ValidationManager)
+from voltaire_bundler.user_operation.models import StakeInfo
+
+ENTRYPOINT = "0x5FF137D4b0FDCD49DcA30c7CF57E578a026d2789"
+SENDER = "0x" + "aa" * 20
+PAYMASTER = "0x" + "bb" * 20
+TOKEN = "0x" + "cc" * 20
+UNSTAKED = StakeInfo(0, 0)
+
+
+def pad(value: bytes) -> bytes:
+    return value.rjust(32, b"\0")
+
+
+# the keccak preimage of balances[SENDER] for a mapping at slot 0
+SENDER_MAPPING_PREIMAGE = pad(bytes.fromhex(SENDER[2:])) + pad(b"")
+SENDER_MAPPING_SLOT = int.from_bytes(keccak(SENDER_MAPPING_PREIMAGE))
+# the sender is the mapping value key and not at the start of the preimage
+SENDER_NOT_FIRST_PREIMAGE = pad(b"\x01") + pad(bytes.fromhex(SENDER[2:]))
+SENDER_NOT_FIRST_SLOT = int.from_bytes(keccak(SENDER_NOT_FIRST_PREIMAGE))
+
+
+def sender_associated_slots(preimage: bytes) -> dict[str, list[int]]:
+    return ValidationManager.parse_entity_slots(
+        [SENDER], {"0x" + preimage.hex()})
+
+
+@pytest.mark.parametrize(
+    "offset, is_associated",
+    [
+        (-1, False),
+        (0, True),
+        (ASSOCIATED_SLOT_RANGE - 1, True),
+        (ASSOCIATED_SLOT_RANGE, False),
+        (127, False),
+        (128, False),
+    ],
+)
+def test_slot_association_range(offset, is_associated):
+    """
+    Test the slots from the associated slot up to ASSOCIATED_SLOT_RANGE
+    after it are associated
+    """
+    associated_slots = sender_associated_slots(SENDER_MAPPING_PREIMAGE)[SENDER]
+
+    assert associated_slots == [SENDER_MAPPING_SLOT]
+    assert ValidationManager.is_slot_associated_with_address(
+        SENDER_MAPPING_SLOT + offset, SENDER, associated_slots
+    ) is is_associated
+
+
+def test_slot_equal_to_the_address_is_associated():
+    """
+    Test the slot holding the address itself is associated
+    """
+    assert ValidationManager.is_slot_associated_with_address(
+        int(SENDER, 16), SENDER, [])
+    assert not ValidationManager.is_slot_associated_with_address(
+        int(SENDER, 16) + 1, SENDER, [])
+
+
+def test_preimage_without_the_address_first_is_not_associated():
+    """
+    Test a keccak preimage with the address after its first word doesn't
+    associate the slot
+    """
+    associated_slots = sender_associated_slots(SENDER_NOT_FIRST_PREIMAGE)[SENDER]
+
+    assert associated_slots == []
+    assert not ValidationManager.is_slot_associated_with_address(
+        SENDER_NOT_FIRST_SLOT, SENDER, associated_slots)
+
+
+@pytest.mark.parametrize("prefix", ["", "0x"])
+def test_tracer_slots_are_parsed_with_and_without_prefix(prefix):
+    """
+    Test the tracer slots are parsed to the same int with or without 0x
+    """
+    access = ValidationManager.format_entity_access(
+        {TOKEN: {"reads": {prefix + "1f": 2}, "writes": {prefix + "00": 1}}}
+    )
+
+    assert access == {TOKEN: {"reads": {31: 2}, "writes": {0: 1}}}
+
+
+@pytest.fixture
+def validation_manager():
+    return ValidationManager(
+        None, "http://127.0.0.1:8545", None, "", "", 1337, "", False, False,
+        [], 10, "http://127.0.0.1:8545", 10,
+    )
+
+
+@pytest.mark.parametrize("prefix", ["", "0x"])
+@pytest.mark.parametrize(
+    "offset, is_allowed",
+    [(0, True), (ASSOCIATED_SLOT_RANGE - 1, True), (ASSOCIATED_SLOT_RANGE, False)],
+)
+def test_unstaked_paymaster_access_to_sender_slots(
+    validation_manager, prefix, offset, is_allowed
+):
+    """
+    Test an unstaked paymaster can only access the sender associated slots
+    of another contract
+    """
+    access = ValidationManager.format_entity_access(
+        {
+            TOKEN: {
+                "reads": {prefix + f"{SENDER_MAPPING_SLOT + offset:x}": 1},
+                "writes": {},
+            }
+        }
+    )
+
+    def validate():
+        validation_manager.validate_entity_storage_access(
+            ENTRYPOINT,
+            PAYMASTER,
+            "paymaster",
+            sender_associated_slots(SENDER_MAPPING_PREIMAGE),
+            UNSTAKED,
+            SENDER,
+            access,
+            False,
+        )
+
+    if is_allowed:
+        validate()
+    else:
+        with pytest.raises(ValidationException, match="banned access to slot"):
+            validate()
+
+
+def test_unstaked_paymaster_access_to_slot_not_first_in_preimage(
+    validation_manager,
+):
+    """
+    Test an unstaked paymaster can't access a slot whose preimage doesn't
+    start with the sender
+    """
+    access = ValidationManager.format_entity_access(
+        {TOKEN: {"reads": {}, "writes": {f"{SENDER_NOT_FIRST_SLOT:x}": 1}}}
+    )
+
+    with pytest.raises(ValidationException, match="banned access to slot"):
+        validation_manager.validate_entity_storage_access(
+            ENTRYPOINT,
+            PAYMASTER,
+            "paymaster",
+            sender_associated_slots(SENDER_NOT_FIRST_PREIMAGE),
+            UNSTAKED,
+            SENDER,
+            access,
+            False,
+        )
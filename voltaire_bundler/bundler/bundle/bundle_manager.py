@@ -1,9 +1,11 @@
 import asyncio
 import logging
 import math
-from typing import List
+from typing import Any, List
 
 from eth_account import Account
+from eth_account.signers.local import LocalAccount
+from eth_utils import to_canonical_address
 
 from voltaire_bundler.bundler.exceptions import ExecutionException
 from voltaire_bundler.bundler.mempool.mempool_manager import \
@@ -13,20 +15,33 @@ from voltaire_bundler.user_operation.user_operation import UserOperation
 from voltaire_bundler.user_operation.user_operation_handler import \
     UserOperationHandler
 from voltaire_bundler.utils.decode import decode_FailedOp_event
-from voltaire_bundler.utils.encode import encode_handleops_calldata
-from voltaire_bundler.utils.eth_client_utils import \
-    send_rpc_request_to_eth_client
+from voltaire_bundler.utils.encode import (
+    encode_handleops_calldata_from_encoded_user_operations,
+    encode_user_operation)
+from voltaire_bundler.utils.eth_client_utils import (
+    send_rpc_batch_request_to_eth_client, send_rpc_request_to_eth_client)
 
 from ..gas_manager import GasManager
 from ..reputation_manager import ReputationManager
 from ..validation_manager import ValidationManager
 
+HANDLE_OPS_BASE_GAS = 21_000
+HANDLE_OPS_PER_OP_GAS = 5_000
+CONDITIONAL_BUNDLE_MAX_BLOCK_RANGE = 10
+FAILED_OP_ERROR_CODES_TO_ENTITY_ATTRIBUTE = {
+    "AA1": "factory_address_lowercase",
+    "AA2": "sender_address",
+    "AA3": "paymaster_address_lowercase",
+}
+
 
 class BundlerManager:
     ethereum_node_url: str
     bundler_private_key: str
+    bundler_account: LocalAccount
     bundler_address: str
     entrypoints_addresses_to_local_mempools: dict[Address, LocalMempoolManager]
+    entrypoints_addresses_to_canonical_addresses: dict[str, bytes]
     user_operation_handler: UserOperationHandler
     reputation_manager: ReputationManager
     chain_id: int
@@ -37,6 +52,10 @@ class BundlerManager:
     entrypoints_addresses_to_send_queue: dict[str, List[UserOperation]]
     entrypoints_addresses_to_verify_inclusion_queue: dict[str, List[UserOperation]]
     gas_price_percentage_multiplier: int
+    max_rpc_batch_size: int
+    bundler_nonce: int | None
+    bundler_nonce_lock: asyncio.Lock
+    inflight_bundle_task: asyncio.Task[None] | None
 
     def __init__(
         self,
@@ -52,15 +71,24 @@ class BundlerManager:
         is_send_raw_transaction_conditional: bool,
         max_fee_per_gas_percentage_multiplier: int,
         max_priority_fee_per_gas_percentage_multiplier: int,
+        max_rpc_batch_size: int,
     ):
         self.entrypoints_addresses_to_local_mempools = (
             entrypoints_addresses_to_local_mempools
         )
+        # the static transaction fields are normalized once instead of on
+        # every signed bundle
+        self.entrypoints_addresses_to_canonical_addresses = {
+            entrypoint: to_canonical_address(entrypoint)
+            for entrypoint in entrypoints_addresses_to_local_mempools
+        }
         self.user_operation_handler = user_operation_handler
         self.reputation_manager = reputation_manager
         self.gas_manager = gas_manager
         self.ethereum_node_url = ethereum_node_url
         self.bundler_private_key = bundler_private_key
+        # parse the private key once instead of on every signed bundle
+        self.bundler_account = Account.from_key(bundler_private_key)
         self.bundler_address = bundler_address
         self.chain_id = chain_id
         self.is_legacy_mode = is_legacy_mode
@@ -73,18 +101,64 @@ class BundlerManager:
         )
         self.entrypoints_addresses_to_send_queue = dict()
         self.gas_price_percentage_multiplier = 100
-
-    async def send_next_bundle(self) -> None:
-        for entrypoint, send_queue in self.entrypoints_addresses_to_send_queue.items():
+        self.max_rpc_batch_size = max_rpc_batch_size
+        # the bundler is the only signer of bundler_address, so the nonce is
+        # tracked locally and only fetched again from the node when out of sync
+        self.bundler_nonce = None
+        self.bundler_nonce_lock = asyncio.Lock()
+        self.inflight_bundle_task = None
+
+    async def send_next_bundle(self) -> asyncio.Task[None]:
+        # the bundle is sent in the background so that the user operations of
+        # the next bundle are fetched from the mempool while it is in flight,
+        # the previous bundle is awaited before sending the next one
+        await self.wait_for_inflight_bundle()
+        inflight_bundle_task = asyncio.create_task(self.send_queued_bundles())
+        self.inflight_bundle_task = inflight_bundle_task
+        return inflight_bundle_task
+
+    async def wait_for_inflight_bundle(self) -> None:
+        # another caller can schedule a new bundle while this one waits
+        while self.inflight_bundle_task is not None:
+            inflight_bundle_task = self.inflight_bundle_task
+            try:
+                # shielded so that a cancelled caller doesn't cancel the bundle
+                await asyncio.shield(inflight_bundle_task)
+            except Exception:
+                logging.exception("Failed to send the previous bundle")
+            finally:
+                if self.inflight_bundle_task is inflight_bundle_task:
+                    self.inflight_bundle_task = None
+
+    async def send_queued_bundles(self) -> None:
+        for entrypoint, send_queue in list(
+            self.entrypoints_addresses_to_send_queue.items()
+        ):
             user_operations = send_queue
             numbder_of_user_operations = len(send_queue)
 
             if numbder_of_user_operations > 0:
                 logging.info(
-                    f"Sending bundle with {numbder_of_user_operations} user operations"
+                    "Sending bundle with %d user operations",
+                    numbder_of_user_operations,
                 )
+                # update_send_queue can add user operations while the bundle
+                # is in flight, the ones not sent are put back before them
+                self.entrypoints_addresses_to_send_queue[entrypoint] = []
+                try:
+                    user_operations_not_sent = await self.send_bundle(
+                        user_operations, entrypoint
+                    )
+                except BaseException:
+                    # the user operations are retried with the next bundle
+                    self.entrypoints_addresses_to_send_queue[entrypoint] = (
+                        user_operations
+                        + self.entrypoints_addresses_to_send_queue[entrypoint]
+                    )
+                    raise
                 self.entrypoints_addresses_to_send_queue[entrypoint] = (
-                    await self.send_bundle(user_operations, entrypoint)
+                    user_operations_not_sent
+                    + self.entrypoints_addresses_to_send_queue[entrypoint]
                 )
 
     async def update_send_queue(self) -> None:
@@ -100,48 +174,37 @@ class BundlerManager:
     async def send_bundle(
         self, user_operations: list[UserOperation], entrypoint: str
     ) -> list[UserOperation]:
-        user_operations_list = []
-        gas_estimation = 0
-        for user_operation in user_operations:
-            user_operations_list.append(user_operation.to_list())
-            gas_estimation += (
-                user_operation.call_gas_limit
-                + user_operation.verification_gas_limit * 3
-            )
-        gas_estimation += 10_000
+        async with self.bundler_nonce_lock:
+            return await self._send_bundle(user_operations, entrypoint)
 
-        call_data = encode_handleops_calldata(
-            user_operations_list, self.bundler_address
-        )
-
-        block_max_fee_per_gas_op = send_rpc_request_to_eth_client(
-            self.ethereum_node_url, "eth_gasPrice"
-        )
+    async def _send_bundle(
+        self, user_operations: list[UserOperation], entrypoint: str
+    ) -> list[UserOperation]:
+        rpc_requests: list[tuple[str, Any]] = [("eth_gasPrice", None)]
 
-        nonce_op = send_rpc_request_to_eth_client(
-            self.ethereum_node_url,
-            "eth_getTransactionCount",
-            [self.bundler_address, "latest"],
-        )
+        if not self.is_legacy_mode:
+            rpc_requests.append(("eth_maxPriorityFeePerGas", None))
 
-        tasks_arr = [
-            block_max_fee_per_gas_op,
-            nonce_op,
-        ]
+        if self.is_send_raw_transaction_conditional:
+            block_number_index = len(rpc_requests)
+            rpc_requests.append(("eth_blockNumber", None))
 
-        if not self.is_legacy_mode:
-            block_max_priority_fee_per_gas_op = send_rpc_request_to_eth_client(
-                self.ethereum_node_url, "eth_maxPriorityFeePerGas"
+        is_fetch_nonce = self.bundler_nonce is None
+        if is_fetch_nonce:
+            rpc_requests.append(
+                ("eth_getTransactionCount", [self.bundler_address, "pending"])
             )
-            tasks_arr.append(block_max_priority_fee_per_gas_op)
 
         try:
-            tasks = await asyncio.gather(*tasks_arr)
+            tasks = await send_rpc_batch_request_to_eth_client(
+                self.ethereum_node_url, rpc_requests, self.max_rpc_batch_size
+            )
         except ExecutionException:
             return []
 
         block_max_fee_per_gas = tasks[0]["result"]
-        nonce = tasks[1]["result"]
+        if is_fetch_nonce:
+            self.bundler_nonce = int(tasks[-1]["result"], 16)
 
         block_max_fee_per_gas_dec = int(block_max_fee_per_gas, 16)
         block_max_fee_per_gas_dec_mod = math.ceil(
@@ -153,7 +216,7 @@ class BundlerManager:
 
         block_max_priority_fee_per_gas = 0
         if not self.is_legacy_mode:
-            block_max_priority_fee_per_gas = tasks[2]["result"]
+            block_max_priority_fee_per_gas = tasks[1]["result"]
             block_max_priority_fee_per_gas_dec = int(
                     block_max_priority_fee_per_gas, 16)
             block_max_priority_fee_per_gas_dec_mod = math.ceil(
@@ -164,183 +227,257 @@ class BundlerManager:
             block_max_priority_fee_per_gas = hex(
                     block_max_priority_fee_per_gas_dec_mod)
 
-        txnDict = {
-            "chainId": self.chain_id,
-            "from": self.bundler_address,
-            "to": entrypoint,
-            "nonce": nonce,
-            "gas": gas_estimation,
-            "data": call_data,
-        }
-
+        gas_price_fields: dict[str, Any]
         if self.is_legacy_mode:
-            txnDict.update(
-                {
-                    "gasPrice": block_max_fee_per_gas,
-                }
-            )
+            gas_price_fields = {
+                "gasPrice": block_max_fee_per_gas,
+            }
         else:
-            txnDict.update(
-                {
-                    "maxFeePerGas": block_max_fee_per_gas,
-                    "maxPriorityFeePerGas": block_max_priority_fee_per_gas,
-                }
-            )
+            gas_price_fields = {
+                "maxFeePerGas": block_max_fee_per_gas,
+                "maxPriorityFeePerGas": block_max_priority_fee_per_gas,
+            }
 
-        sign_store_txn = Account.sign_transaction(
-            txnDict, private_key=self.bundler_private_key
+        entrypoint_canonical_address = (
+            self.entrypoints_addresses_to_canonical_addresses[entrypoint]
         )
+
         rpc_call = "eth_sendRawTransaction"
+        conditional_options = None
         if self.is_send_raw_transaction_conditional:
             rpc_call = "eth_sendRawTransactionConditional"
-
-        result = await send_rpc_request_to_eth_client(
-            self.ethereum_node_url,
-            rpc_call,
-            [sign_store_txn.rawTransaction.hex()],
+            # the bundle is only valid for a few blocks after the one it was
+            # built on, so that the node can reject a stale bundle without
+            # executing it
+            block_number = int(tasks[block_number_index]["result"], 16)
+            conditional_options = {
+                "blockNumberMin": hex(block_number),
+                "blockNumberMax": hex(
+                    block_number + CONDITIONAL_BUNDLE_MAX_BLOCK_RANGE),
+            }
+
+        # abi encoding and signing are cpu bound, they run in a worker
+        # thread to not block the event loop on big bundles
+        encoded_user_operations = await asyncio.to_thread(
+            self.encode_user_operations, user_operations
         )
-        if "error" in result:
-            if "data" in result["error"] and ValidationManager.check_if_failed_op_error(
-                result["error"]["data"][:10]
-            ):
-                error_data = result["error"]["data"]
-
-                solidity_error_params = error_data[10:]
-                (
-                    operation_index,
-                    reason,
-                ) = decode_FailedOp_event(solidity_error_params)
-                user_operation = user_operations[operation_index]
-
-                if (
-                    "AA3" in reason
-                    and user_operation.paymaster_address_lowercase is not None
-                ):
-                    self.reputation_manager.ban_entity(
-                        user_operation.paymaster_address_lowercase
-                    )
-                elif "AA2" in reason:
-                    self.reputation_manager.ban_entity(
-                            user_operation.sender_address)
-                elif (
-                    "AA1" in reason
-                    and user_operation.factory_address_lowercase is not None
-                ):
-                    self.reputation_manager.ban_entity(
-                        user_operation.factory_address_lowercase
-                    )
 
+        # the gas price, the nonce and the encoded user operations are reused
+        # when retrying the bundle after dropping a user operation that caused
+        # the bundle to crash
+        while len(user_operations) > 0:
+            gas_estimation = self._estimate_handle_ops_gas(user_operations)
+
+            call_data = encode_handleops_calldata_from_encoded_user_operations(
+                encoded_user_operations, self.bundler_address
+            )
+
+            # "from" is left out as the transaction is signed by the
+            # bundler account anyway
+            txnDict = {
+                "chainId": self.chain_id,
+                "to": entrypoint_canonical_address,
+                "nonce": self.bundler_nonce,
+                "gas": gas_estimation,
+                "data": call_data,
+            }
+            txnDict.update(gas_price_fields)
+
+            sign_store_txn = await asyncio.to_thread(
+                self.bundler_account.sign_transaction, txnDict
+            )
+
+            send_params: list[Any] = [sign_store_txn.rawTransaction.hex()]
+            if conditional_options is not None:
+                send_params.append(conditional_options)
+
+            try:
+                result = await send_rpc_request_to_eth_client(
+                    self.ethereum_node_url, rpc_call, send_params
+                )
+            except BaseException:
+                # the node may have accepted the transaction before failing
+                self.bundler_nonce = None
+                raise
+
+            if "error" not in result:
+                transaction_hash = result["result"]
                 logging.info(
-                        "Dropping user operation that caused bundle crash")
-                del user_operations[operation_index]
+                    "Bundle was sent with transaction hash : %s", transaction_hash)
+                self.gas_price_percentage_multiplier = 100
+                self.bundler_nonce += 1
+
+                # todo : check if bundle was included on chain
+                self.update_included_status(user_operations)
+                return []
+
+            send_error = result["error"]
+            error_data = send_error.get("data")
+            if not isinstance(error_data, str) or len(error_data) < 10:
+                return self.handle_send_bundle_error(send_error, user_operations)
 
-                if len(user_operations) > 0:
-                    await self.send_bundle(user_operations, entrypoint)
+            solidity_error_selector = error_data[:10]
+            if not ValidationManager.check_if_failed_op_error(
+                solidity_error_selector
+            ):
+                return self.handle_send_bundle_error(send_error, user_operations)
+
+            solidity_error_params = error_data[10:]
+            (
+                operation_index,
+                reason,
+            ) = decode_FailedOp_event(solidity_error_params)
+            user_operation = user_operations[operation_index]
+
+            # the entrypoint FailedOp reasons start with the error code,
+            # AA1x, AA2x and AA3x are caused by the factory, the sender and
+            # the paymaster
+            entity_attribute = FAILED_OP_ERROR_CODES_TO_ENTITY_ATTRIBUTE.get(
+                reason[:3]
+            )
+            if entity_attribute is not None:
+                entity_address = getattr(user_operation, entity_attribute)
+                if entity_address is not None:
+                    self.reputation_manager.ban_entity(entity_address)
+
+            logging.info(
+                    "Dropping user operation that caused bundle crash")
+            del user_operations[operation_index]
+            del encoded_user_operations[operation_index]
 
+        return []
+
+    def handle_send_bundle_error(
+        self, send_error: dict[str, Any], user_operations: list[UserOperation]
+    ) -> list[UserOperation]:
+        # a transaction can already be in the pool at the local nonce, so it
+        # is fetched again for the next bundle whatever the error
+        self.bundler_nonce = None
+        if "message" in send_error:
+            logging.info("Failed to send bundle.%s", send_error)
+            # ErrAlreadyKnown is returned if the transactions is already
+            # contained within the pool.
+            if "already known" in send_error["message"]:
                 return []
-            elif "message" in result["error"]:
-                logging.info("Failed to send bundle." + str(result["error"]))
-                # ErrAlreadyKnown is returned if the transactions is already
-                # contained within the pool.
-                if "already known" in result["error"]["message"]:
+            # ErrNonceTooLow is returned if the nonce of a transaction is
+            # lower than the one present in the local chain.
+            elif "nonce too low" in send_error["message"]:
+                return user_operations
+            # ErrInvalidSender is returned if the transaction
+            # contains an invalid signature.
+            elif "invalid sender" in send_error["message"]:
+                pass  # todo
+            # ErrUnderpriced is returned if a transaction's gas price
+            # is below the minimum configured for the transaction pool.
+            elif "transaction underpriced" in send_error["message"]:
+                # retry sending useroperations with higher gas price
+                # if the gas_price_percentage_multiplier reached 200,
+                # drop the user_operations
+                if self.gas_price_percentage_multiplier <= 200:
+                    self.gas_price_percentage_multiplier += 10
+                    return user_operations
+                else:
+                    logging.info(
+                        "Failed to send bundle. Dropping all user operations%s",
+                        send_error,
+                    )
                     return []
-                # ErrInvalidSender is returned if the transaction
-                # contains an invalid signature.
-                elif "invalid sender" in result["error"]["message"]:
-                    pass  # todo
-                # ErrUnderpriced is returned if a transaction's gas price
-                # is below the minimum configured for the transaction pool.
-                elif "transaction underpriced" in result["error"]["message"]:
-                    # retry sending useroperations with higher gas price
-                    # if the gas_price_percentage_multiplier reached 200,
-                    # drop the user_operations
-                    if self.gas_price_percentage_multiplier <= 200:
-                        self.gas_price_percentage_multiplier += 10
-                        return user_operations
-                    else:
-                        logging.info(
-                            "Failed to send bundle. Dropping all user operations"
-                            + str(result["error"])
-                        )
-                        return []
-                # ErrReplaceUnderpriced is returned if a transaction is
-                # attempted to be replaced with a different one without
-                # the required price bump.
-                elif (
-                    "replacement transaction underpriced" in result["error"]["message"]
-                ):
-                    if self.gas_price_percentage_multiplier <= 200:
-                        self.gas_price_percentage_multiplier += 10
-                        return user_operations
-                    else:
-                        logging.info(
-                            "Failed to send bundle. Dropping all user operations"
-                            + str(result["error"])
-                        )
-                        return []
-                # ErrAccountLimitExceeded is returned if a transaction would
-                # exceed the number allowed by a pool for a single account.
-                elif "account limit exceeded" in result["error"]["message"]:
-                    pass  # todo
-                # ErrGasLimit is returned if a transaction's requested gas
-                # limit exceeds the maximum allowance of the current block.
-                elif "exceeds block gas limit" in result["error"]["message"]:
-                    pass  # todo
-                # ErrNegativeValue is a sanity error to ensure no one is able
-                # to specify a transaction with a negative value.
-                elif "negative value" in result["error"]["message"]:
-                    pass  # todo
-                # ErrOversizedData is returned if the input data of
-                # a transaction is greater than some meaningful limit a user
-                # might use. This is not a consensus error making
-                # the transaction invalid, rather a DOS protection.
-                elif "oversized data" in result["error"]["message"]:
-                    pass  # todo
-                # ErrFutureReplacePending is returned if a future transaction
-                # replaces a pending one. Future transactions should only
-                # be able to replace other future transactions.
-                elif (
-                    "future transaction tries to replace pending"
-                    in result["error"]["message"]
-                ):
-                    pass  # todo
+            # ErrReplaceUnderpriced is returned if a transaction is
+            # attempted to be replaced with a different one without
+            # the required price bump.
+            elif "replacement transaction underpriced" in send_error["message"]:
+                if self.gas_price_percentage_multiplier <= 200:
+                    self.gas_price_percentage_multiplier += 10
+                    return user_operations
                 else:
                     logging.info(
-                        "Failed to send bundle. Dropping all user operations"
-                        + str(result["error"])
+                        "Failed to send bundle. Dropping all user operations%s",
+                        send_error,
                     )
                     return []
+            # ErrAccountLimitExceeded is returned if a transaction would
+            # exceed the number allowed by a pool for a single account.
+            elif "account limit exceeded" in send_error["message"]:
+                pass  # todo
+            # ErrGasLimit is returned if a transaction's requested gas
+            # limit exceeds the maximum allowance of the current block.
+            elif "exceeds block gas limit" in send_error["message"]:
+                pass  # todo
+            # ErrNegativeValue is a sanity error to ensure no one is able
+            # to specify a transaction with a negative value.
+            elif "negative value" in send_error["message"]:
+                pass  # todo
+            # ErrOversizedData is returned if the input data of
+            # a transaction is greater than some meaningful limit a user
+            # might use. This is not a consensus error making
+            # the transaction invalid, rather a DOS protection.
+            elif "oversized data" in send_error["message"]:
+                pass  # todo
+            # ErrFutureReplacePending is returned if a future transaction
+            # replaces a pending one. Future transactions should only
+            # be able to replace other future transactions.
+            elif (
+                "future transaction tries to replace pending"
+                in send_error["message"]
+            ):
+                pass  # todo
             else:
                 logging.info(
-                    "Failed to send bundle. Dropping all user operations"
-                    + str(result["error"])
+                    "Failed to send bundle. Dropping all user operations%s",
+                    send_error,
                 )
                 return []
-            return []
         else:
-            transaction_hash = result["result"]
             logging.info(
-                    "Bundle was sent with transaction hash : " + transaction_hash)
-            self.gas_price_percentage_multiplier = 100
-
-            # todo : check if bundle was included on chain
-            for user_operation in user_operations:
-                self.update_included_status(
-                    user_operation.sender_address,
-                    user_operation.factory_address_lowercase,
-                    user_operation.paymaster_address_lowercase,
-                )
+                "Failed to send bundle. Dropping all user operations%s",
+                send_error,
+            )
             return []
+        return []
+
+    @staticmethod
+    def encode_user_operations(
+        user_operations: list[UserOperation],
+    ) -> list[bytes]:
+        return [
+            encode_user_operation(user_operation.to_list())
+            for user_operation in user_operations
+        ]
+
+    @staticmethod
+    def _estimate_handle_ops_gas(user_operations: list[UserOperation]) -> int:
+        # the handleOps gas computed from the user operations gas fields.
+        # verificationGasLimit is counted 3 times for every user operation:
+        # the validation can use all of it, innerHandleOp then requires
+        # callGasLimit + verificationGasLimit + 5000 of gasleft() and postOp
+        # can be called twice when there is a paymaster
+        return (
+            HANDLE_OPS_BASE_GAS
+            + HANDLE_OPS_PER_OP_GAS * len(user_operations)
+            + sum(
+                user_operation.pre_verification_gas
+                + user_operation.verification_gas_limit * 3
+                + user_operation.call_gas_limit
+                for user_operation in user_operations
+            )
+        )
 
     def update_included_status(
-        self, sender_address: str,
-        factory_address: str | None,
-        paymaster_address: str | None
+        self, user_operations: list[UserOperation]
     ) -> None:
-        self.reputation_manager.update_included_status(sender_address)
-
-        if factory_address is not None:
-            self.reputation_manager.update_included_status(factory_address)
-
-        if paymaster_address is not None:
-            self.reputation_manager.update_included_status(paymaster_address)
+        senders = [
+            user_operation.sender_address for user_operation in user_operations
+        ]
+        factories = [
+            user_operation.factory_address_lowercase
+            for user_operation in user_operations
+            if user_operation.factory_address_lowercase is not None
+        ]
+        paymasters = [
+            user_operation.paymaster_address_lowercase
+            for user_operation in user_operations
+            if user_operation.paymaster_address_lowercase is not None
+        ]
+        self.reputation_manager.update_included_status_bulk(senders)
+        self.reputation_manager.update_included_status_bulk(factories)
+        self.reputation_manager.update_included_status_bulk(paymasters)
@@ -55,6 +55,7 @@ class ExecutionEndpoint(Endpoint):
     disabe_p2p: bool
     max_verification_gas: int
     max_call_data_gas: int
+    max_rpc_batch_size: int
 
     def __init__(
         self,
@@ -80,6 +81,7 @@ class ExecutionEndpoint(Endpoint):
         disable_p2p: bool,
         max_verification_gas: int,
         max_call_data_gas: int,
+        max_rpc_batch_size: int,
     ):
         super().__init__("bundler_endpoint")
         self.ethereum_node_url = ethereum_node_url
@@ -134,6 +136,7 @@ class ExecutionEndpoint(Endpoint):
             whitelist_entity_storage_access,
             enforce_gas_price_tolerance,
             ethereum_node_debug_trace_call_url,
+            max_rpc_batch_size,
         )
         self.entrypoints_to_local_mempools = dict()
         self.entrypoints_lowercase_to_checksummed = dict()
@@ -211,6 +214,7 @@ class ExecutionEndpoint(Endpoint):
             is_send_raw_transaction_conditional,
             max_fee_per_gas_percentage_multiplier,
             max_priority_fee_per_gas_percentage_multiplier,
+            max_rpc_batch_size,
         )
         self.peer_ids_to_cursor = dict()
         self.peer_ids_to_user_ops_hashes_queue = dict()
@@ -416,7 +420,8 @@ class ExecutionEndpoint(Endpoint):
 
     async def _event_debug_bundler_sendBundleNow(self, _) -> str:
         await self.bundle_manager.update_send_queue()
-        await self.bundle_manager.send_next_bundle()
+        bundle_task = await self.bundle_manager.send_next_bundle()
+        await asyncio.shield(bundle_task)
 
         return "ok"
 
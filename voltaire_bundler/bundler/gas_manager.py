@@ -398,8 +398,7 @@ class GasManager:
         )
 
         function_selector = "0x49948e0e"  # getL1Fee
-        call_data_params = encode(
-                ["bytes"], [bytes.fromhex(handleops_calldata[2:])])
+        call_data_params = encode(["bytes"], [handleops_calldata])
 
         call_data = function_selector + call_data_params.hex()
 
@@ -503,7 +502,7 @@ class GasManager:
 
     @staticmethod
     def calc_base_preverification_gas(user_operation: UserOperation) -> int:
-        user_operation_list = user_operation.to_list()
+        user_operation_list = list(user_operation.to_list())
 
         user_operation_list[6] = 21000
 
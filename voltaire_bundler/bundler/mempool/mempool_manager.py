@@ -1,7 +1,9 @@
+import asyncio
+import logging
 import math
 from dataclasses import dataclass
 from functools import cache
-from typing import Any, List
+from typing import Any, Awaitable, List
 
 from eth_abi import encode
 
@@ -23,6 +25,17 @@ from .sender_mempool import SenderMempool
 MAX_OPS_PER_REQUEST = 4096
 
 
+async def gather_raising_in_order(*awaitables: Awaitable[Any]) -> list[Any]:
+    # same as asyncio.gather but the first failed awaitable in the arguments
+    # order raises, not the first one to fail, so that the error doesn't
+    # depend on which rpc call returns first
+    results = await asyncio.gather(*awaitables, return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
+
+
 class LocalMempoolManager:
     supported_mempools_types_to_mempools_ids: dict[MempoolType, MempoolId]
     verified_useroperations_standard_mempool_gossip_queue: List[Any]
@@ -132,21 +145,34 @@ class LocalMempoolManagerVersion0Point6(LocalMempoolManager):
         user_operation: UserOperation,
     ) -> tuple[str, str, List[MempoolId]]:
 
-        latest_block_number, _, _, latest_block_timestamp, latest_block_hash = (
-            await get_latest_block_info(self.ethereum_node_url)
-        )
         self._verify_entities_reputation(
             user_operation.sender_address,
             user_operation.factory_address_lowercase,
             user_operation.paymaster_address_lowercase,
         )
 
-        await self.gas_manager.verify_preverification_gas_and_verification_gas_limit(
-            user_operation,
-            self.entrypoint,
-        )
-        gas_price_hex = await self.gas_manager.verify_gas_fees_and_get_price(
-            user_operation, self.enforce_gas_price_tolerance
+        # the latest block and the gas checks don't depend on each other,
+        # their rpc calls are sent concurrently and their errors are raised
+        # in that order
+        (
+            (
+                latest_block_number,
+                _,
+                _,
+                latest_block_timestamp,
+                latest_block_hash,
+            ),
+            _,
+            gas_price_hex,
+        ) = await gather_raising_in_order(
+            get_latest_block_info(self.ethereum_node_url),
+            self.gas_manager.verify_preverification_gas_and_verification_gas_limit(
+                user_operation,
+                self.entrypoint,
+            ),
+            self.gas_manager.verify_gas_fees_and_get_price(
+                user_operation, self.enforce_gas_price_tolerance
+            ),
         )
 
         (
@@ -205,22 +231,31 @@ class LocalMempoolManagerVersion0Point6(LocalMempoolManager):
         peer_id: str,
         verified_at_block_hash: str
     ) -> None | str:
-        latest_block_number, _, _, latest_block_timestamp, latest_block_hash = (
-            await get_latest_block_info(self.ethereum_node_url)
-        )
-
         try:
             self._verify_entities_reputation(
                 user_operation.sender_address,
                 user_operation.factory_address_lowercase,
                 user_operation.paymaster_address_lowercase,
             )
-            await self.gas_manager.verify_preverification_gas_and_verification_gas_limit(
-                user_operation,
-                self.entrypoint,
-            )
-            gas_price_hex = await self.gas_manager.verify_gas_fees_and_get_price(
-                user_operation, self.enforce_gas_price_tolerance
+            (
+                (
+                    latest_block_number,
+                    _,
+                    _,
+                    latest_block_timestamp,
+                    latest_block_hash,
+                ),
+                _,
+                gas_price_hex,
+            ) = await gather_raising_in_order(
+                get_latest_block_info(self.ethereum_node_url),
+                self.gas_manager.verify_preverification_gas_and_verification_gas_limit(
+                    user_operation,
+                    self.entrypoint,
+                ),
+                self.gas_manager.verify_gas_fees_and_get_price(
+                    user_operation, self.enforce_gas_price_tolerance
+                ),
             )
         except ValidationException:
             return "No"
@@ -301,30 +336,68 @@ class LocalMempoolManagerVersion0Point6(LocalMempoolManager):
         return user_operation_hash in self.seen_user_operation_hashs
 
     async def get_user_operations_to_bundle(self) -> list[UserOperation]:
-        bundle = []
+        # the first user operation of every sender, it is only removed from
+        # the sender mempool once its code hash is checked
+        senders_and_user_operations = []
         for sender_address in list(self.senders_to_senders_mempools):
             sender = self.senders_to_senders_mempools[sender_address]
             if len(sender.user_operation_hashs_to_verified_user_operation) > 0:
+                user_operation_hash = next(
+                    iter(sender.user_operation_hashs_to_verified_user_operation)
+                )
                 user_operation = (
-                    sender.user_operation_hashs_to_verified_user_operation.pop(
-                        next(
-                            iter(sender.user_operation_hashs_to_verified_user_operation)
-                        )
-                    ).user_operation
+                    sender.user_operation_hashs_to_verified_user_operation[
+                        user_operation_hash
+                    ].user_operation
+                )
+                senders_and_user_operations.append(
+                    (sender, user_operation_hash, user_operation)
                 )
 
-                if not self.is_unsafe:
-                    new_code_hash = (
-                        await self.validation_manager.get_addresses_code_hash(
-                            user_operation.associated_addresses
-                        )
+        new_code_hashes: list[str | BaseException] = []
+        if not self.is_unsafe:
+            # the code hashes of the senders are fetched concurrently, a
+            # failed fetch only keeps its user operation for the next bundle
+            new_code_hashes = await asyncio.gather(
+                *[
+                    self.validation_manager.get_addresses_code_hash(
+                        user_operation.associated_addresses
+                    )
+                    for _, _, user_operation in senders_and_user_operations
+                ],
+                return_exceptions=True,
+            )
+
+        bundle = []
+        for index, (sender, user_operation_hash, user_operation) in enumerate(
+            senders_and_user_operations
+        ):
+            if not self.is_unsafe:
+                new_code_hash = new_code_hashes[index]
+                if isinstance(new_code_hash, BaseException):
+                    logging.warning(
+                        "Failed to fetch the code hash of user operation %s: %s",
+                        user_operation_hash,
+                        new_code_hash,
                     )
-                    if new_code_hash != user_operation.code_hash:
-                        continue
+                    continue
+
+            # the user operation can be removed while the code hashes are
+            # fetched
+            if (
+                sender.user_operation_hashs_to_verified_user_operation.pop(
+                    user_operation_hash, None
+                )
+                is None
+            ):
+                continue
+
+            if not self.is_unsafe and new_code_hash != user_operation.code_hash:
+                continue
 
-                bundle.append(user_operation)
-                if len(sender.user_operation_hashs_to_verified_user_operation) == 0:
-                    del self.senders_to_senders_mempools[sender.address]
+            bundle.append(user_operation)
+            if len(sender.user_operation_hashs_to_verified_user_operation) == 0:
+                del self.senders_to_senders_mempools[sender.address]
 
         return bundle
 
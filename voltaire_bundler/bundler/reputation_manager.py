@@ -1,8 +1,10 @@
 import asyncio
 import logging
 import math
+from collections import Counter
 from dataclasses import field
 from enum import Enum
+from typing import Iterable
 
 MIN_INCLUSION_RATE_DENOMINATOR = 10
 THROTTLING_SLACK = 10
@@ -80,13 +82,22 @@ class ReputationManager:
         ops_seen = self.entities_reputation[entity].ops_seen
         self.entities_reputation[entity].ops_seen = ops_seen + 1
 
-    def update_included_status(self, entity: str) -> None:
+    def update_included_status(
+        self, entity: str, number_of_ops_included: int = 1
+    ) -> None:
         if entity not in self.entities_reputation:
             self.entities_reputation[entity] = ReputationEntry(
                 0, 0, ReputationStatus.OK
             )
         ops_included = self.entities_reputation[entity].ops_included
-        self.entities_reputation[entity].ops_included = ops_included + 1
+        self.entities_reputation[entity].ops_included = (
+            ops_included + number_of_ops_included
+        )
+
+    def update_included_status_bulk(self, entities: Iterable[str]) -> None:
+        # an entity is counted once for every time it appears in entities
+        for entity, number_of_ops_included in Counter(entities).items():
+            self.update_included_status(entity, number_of_ops_included)
 
     def ban_entity(self, entity: str) -> None:
         self.entities_reputation[entity] = ReputationEntry(
@@ -1,8 +1,8 @@
-import asyncio
+import bisect
 import os
+from functools import cache
 from typing import Any
 
-from eth_abi import decode, encode
 from eth_utils import keccak, to_checksum_address
 
 from voltaire_bundler.bundler.exceptions import (ValidationException,
@@ -13,12 +13,41 @@ from voltaire_bundler.user_operation.models import (FailedOpRevertData,
 from voltaire_bundler.user_operation.user_operation import UserOperation
 from voltaire_bundler.user_operation.user_operation_handler import \
     UserOperationHandler
-from voltaire_bundler.utils.decode import decode_FailedOp_event
-from voltaire_bundler.utils.encode import encode_simulate_validation_calldata
-from voltaire_bundler.utils.eth_client_utils import (
-    Call, DebugEntityData, DebugTraceCallData, send_rpc_request_to_eth_client)
+from voltaire_bundler.utils.decode import abi_decoder, decode_FailedOp_event
+from voltaire_bundler.utils.encode import (
+    encode_addresses, encode_simulate_validation_calldata)
+from voltaire_bundler.utils.eth_client_utils import (BatchingRpcClient, Call,
+                                                     DebugEntityData,
+                                                     DebugTraceCallData)
 from voltaire_bundler.typing import Address
 
+FAILED_OP_SELECTOR = bytes.fromhex(FailedOpRevertData.SELECTOR[2:])
+VALID_UNTIL_MIN_MARGIN = 30  # seconds
+# the slots after an entity associated slot that are associated too
+ASSOCIATED_SLOT_RANGE = 18
+
+VALIDATION_RESULT_ABI = [
+    "(uint256,uint256,bool,uint64,uint64,bytes)",  # returnInfo
+    "(uint256,uint256)",  # senderInfo
+    "(uint256,uint256)",  # factoryInfo
+    "(uint256,uint256)",  # paymasterInfo
+]
+# validateUserOp(userOp, userOpHash, missingAccountFunds) params head
+VALIDATE_USER_OP_ABI = ["bytes32", "bytes32", "uint256"]
+
+decode_validation_result_params = abi_decoder(VALIDATION_RESULT_ABI)
+decode_validate_user_op_params = abi_decoder(VALIDATE_USER_OP_ABI)
+
+
+@cache
+def load_bundler_collector_tracer() -> str:
+    package_directory = os.path.dirname(os.path.abspath(__file__))
+    BundlerCollectorTracer_file = os.path.join(
+        package_directory, "..", "utils", "BundlerCollectorTracer.js"
+    )
+    with open(BundlerCollectorTracer_file) as keyfile:
+        return keyfile.read()
+
 
 class ValidationManager:
     user_operation_handler: UserOperationHandler
@@ -28,13 +57,15 @@ class ValidationManager:
     bundler_address: str
     chain_id: int
     bundler_collector_tracer: str
-    banned_opcodes: list
+    banned_opcodes: frozenset[str]
     bundler_helper_byte_code: str
     is_unsafe: bool
     is_legacy_mode: bool
-    whitelist_entity_storage_access: list
+    whitelist_entity_storage_access: frozenset[str]
     enforce_gas_price_tolerance: int
     ethereum_node_debug_trace_call_url: str
+    rpc_client: BatchingRpcClient
+    debug_trace_call_rpc_client: BatchingRpcClient
 
     def __init__(
         self,
@@ -50,6 +81,7 @@ class ValidationManager:
         whitelist_entity_storage_access: list,
         enforce_gas_price_tolerance: int,
         ethereum_node_debug_trace_call_url: str,
+        max_rpc_batch_size: int,
     ):
         self.user_operation_handler = user_operation_handler
         self.ethereum_node_url = ethereum_node_url
@@ -60,35 +92,44 @@ class ValidationManager:
         self.bundler_helper_byte_code = bundler_helper_byte_code
         self.is_unsafe = is_unsafe
         self.is_legacy_mode = is_legacy_mode
-        self.whitelist_entity_storage_access = whitelist_entity_storage_access
+        # the entities addresses are compared lowercase
+        self.whitelist_entity_storage_access = frozenset(
+            address.lower() for address in whitelist_entity_storage_access
+        )
         self.enforce_gas_price_tolerance = enforce_gas_price_tolerance
         self.ethereum_node_debug_trace_call_url = ethereum_node_debug_trace_call_url
+        # the simulation and code hash calls of concurrent user operations
+        # validations are sent as JSON-RPC batches
+        self.rpc_client = BatchingRpcClient(ethereum_node_url, max_rpc_batch_size)
+        if ethereum_node_debug_trace_call_url == ethereum_node_url:
+            self.debug_trace_call_rpc_client = self.rpc_client
+        else:
+            self.debug_trace_call_rpc_client = BatchingRpcClient(
+                ethereum_node_debug_trace_call_url, max_rpc_batch_size
+            )
 
-        package_directory = os.path.dirname(os.path.abspath(__file__))
-        BundlerCollectorTracer_file = os.path.join(
-            package_directory, "..", "utils", "BundlerCollectorTracer.js"
+        self.bundler_collector_tracer = load_bundler_collector_tracer()
+
+        self.banned_opcodes = frozenset(
+            [
+                "GAS",
+                "NUMBER",
+                "TIMESTAMP",
+                "COINBASE",
+                "DIFFICULTY",
+                "BASEFEE",
+                "GASLIMIT",
+                "GASPRICE",
+                "SELFBALANCE",
+                "BALANCE",
+                "ORIGIN",
+                "BLOCKHASH",
+                "CREATE",
+                "SELFDESTRUCT",
+                "RANDOM",
+                "PREVRANDAO",
+            ]
         )
-        with open(BundlerCollectorTracer_file) as keyfile:
-            self.bundler_collector_tracer = keyfile.read()
-
-        self.banned_opcodes = [
-            "GAS",
-            "NUMBER",
-            "TIMESTAMP",
-            "COINBASE",
-            "DIFFICULTY",
-            "BASEFEE",
-            "GASLIMIT",
-            "GASPRICE",
-            "SELFBALANCE",
-            "BALANCE",
-            "ORIGIN",
-            "BLOCKHASH",
-            "CREATE",
-            "SELFDESTRUCT",
-            "RANDOM",
-            "PREVRANDAO",
-        ]
 
     async def validate_user_operation(
         self,
@@ -110,10 +151,13 @@ class ValidationManager:
             debug_data = await self.simulate_validation_with_tracing(
                 user_operation, entrypoint, gas_price_hex, block_number
             )
-            selector = debug_data["debug"][-2]["REVERT"][:10]
-            validation_result = debug_data["debug"][-2]["REVERT"][10:]
+            # the revert data is hex decoded once, the selector and the
+            # params are then sliced from the bytes
+            revert_data = bytes.fromhex(debug_data["debug"][-2]["REVERT"][2:])
+            selector = revert_data[:4]
+            validation_result = revert_data[4:]
 
-        if ValidationManager.check_if_failed_op_error(selector):
+        if selector == FAILED_OP_SELECTOR:
             _, reason = decode_FailedOp_event(validation_result)
             raise ValidationException(
                 ValidationExceptionCode.SimulateValidation,
@@ -132,7 +176,7 @@ class ValidationManager:
 
         if self.is_unsafe:
             user_operation_hash = UserOperationHandler.get_user_operation_hash(
-                user_operation.to_list(), entrypoint, self.chain_id
+                list(user_operation.to_list()), entrypoint, self.chain_id
             )
         else:
             debug_data_formated = ValidationManager.format_debug_traceCall_data(
@@ -156,7 +200,7 @@ class ValidationManager:
 
     async def simulate_validation_without_tracing(
         self, user_operation: UserOperation, entrypoint: str
-    ) -> tuple[str, str]:
+    ) -> tuple[bytes, bytes]:
         call_data = encode_simulate_validation_calldata(user_operation)
 
         params = [
@@ -168,9 +212,7 @@ class ValidationManager:
             "latest",
         ]
 
-        result: Any = await send_rpc_request_to_eth_client(
-            self.ethereum_node_url, "eth_call", params
-        )
+        result: Any = await self.rpc_client.send_rpc_request("eth_call", params)
         if (
             "error" not in result
             or "execution reverted" not in result["error"]["message"]
@@ -187,9 +229,9 @@ class ValidationManager:
                 result["error"]["message"],
             )
 
-        error_data = result["error"]["data"]
-        solidity_error_selector = str(error_data[:10])
-        solidity_error_params = error_data[10:]
+        error_data = bytes.fromhex(result["error"]["data"][2:])
+        solidity_error_selector = error_data[:4]
+        solidity_error_params = error_data[4:]
 
         return solidity_error_selector, solidity_error_params
 
@@ -214,8 +256,8 @@ class ValidationManager:
             {"tracer": self.bundler_collector_tracer},
         ]
 
-        res: Any = await send_rpc_request_to_eth_client(
-            self.ethereum_node_debug_trace_call_url, "debug_traceCall", params
+        res: Any = await self.debug_trace_call_rpc_client.send_rpc_request(
+            "debug_traceCall", params
         )
 
         if "result" in res:
@@ -243,13 +285,58 @@ class ValidationManager:
         paymaster_stake_info: StakeInfo,
         debug_data: DebugTraceCallData,
     ) -> None:
+        # the opcodes check is cheap, it is done before the storage access
+        # rules and the keccak heavy addresses checksum
         factory_opcodes = debug_data.factory_data.opcodes
         account_opcodes = debug_data.account_data.opcodes
         paymaster_opcodes = debug_data.paymaster_data.opcodes
-        await self.check_banned_op_codes(
+        self.check_banned_op_codes(
             factory_opcodes, account_opcodes, paymaster_opcodes
         )
 
+        self.validate_entities_storage_access(
+            user_operation,
+            entrypoint,
+            sender_stake_info,
+            factory_stake_info,
+            paymaster_stake_info,
+            debug_data,
+        )
+
+        factory_address_lowercase = user_operation.factory_address_lowercase
+        paymaster_address_lowercase = user_operation.paymaster_address_lowercase
+
+        associated_addresses_lowercase = list(
+            debug_data.account_data.contract_size
+        )
+        if factory_address_lowercase is not None:
+            associated_addresses_lowercase.extend(
+                debug_data.factory_data.contract_size
+            )
+        if paymaster_address_lowercase is not None:
+            associated_addresses_lowercase.extend(
+                debug_data.paymaster_data.contract_size
+            )
+
+        if len(associated_addresses_lowercase) > 0:
+            associated_addresses = [
+                to_checksum_address(lower_case_address)
+                for lower_case_address in associated_addresses_lowercase
+            ]
+            user_operation.code_hash = await self.get_addresses_code_hash(
+                associated_addresses
+            )
+            user_operation.associated_addresses = associated_addresses
+
+    def validate_entities_storage_access(
+        self,
+        user_operation: UserOperation,
+        entrypoint: str,
+        sender_stake_info: StakeInfo,
+        factory_stake_info: StakeInfo,
+        paymaster_stake_info: StakeInfo,
+        debug_data: DebugTraceCallData,
+    ) -> None:
         sender_address_lowercase = Address(user_operation.sender_address.lower())
         factory_address_lowercase = user_operation.factory_address_lowercase
         paymaster_address_lowercase = user_operation.paymaster_address_lowercase
@@ -279,9 +366,6 @@ class ValidationManager:
             debug_data.account_data.access,
             is_init_code,
         )
-        associated_addresses_lowercase = list(
-            debug_data.account_data.contract_size.keys()
-        )
 
         if factory_address_lowercase is not None:
             self.validate_entity_storage_access(
@@ -294,10 +378,6 @@ class ValidationManager:
                 debug_data.factory_data.access,
                 is_init_code,
             )
-            associated_addresses_lowercase = (
-                associated_addresses_lowercase +
-                list(debug_data.factory_data.contract_size.keys())
-            )
 
         if paymaster_address_lowercase is not None:
             _, paymaster_call = ValidationManager.parse_call_stack(
@@ -314,10 +394,6 @@ class ValidationManager:
                 debug_data.paymaster_data.access,
                 is_init_code,
             )
-            associated_addresses_lowercase = (
-                associated_addresses_lowercase +
-                list(debug_data.paymaster_data.contract_size.keys())
-            )
             is_paymaster_staked = ValidationManager.is_staked(paymaster_stake_info)
             if len(paymaster_call._data) > 194 and not is_paymaster_staked:
                 raise ValidationException(
@@ -325,41 +401,35 @@ class ValidationManager:
                     "unstaked paymaster must not return context",
                 )
 
-        if len(associated_addresses_lowercase) > 0:
-            associated_addresses = [
-                to_checksum_address(lower_case_address)
-                for lower_case_address in associated_addresses_lowercase
-            ]
-            if len(associated_addresses) > 0:
-                user_operation.code_hash = await self.get_addresses_code_hash(
-                    associated_addresses
-                )
-                user_operation.associated_addresses = associated_addresses
-
     def validate_entity_storage_access(
         self,
         entrypoint: str,
         entity_address: str,
         entity_title: str,
-        associated_slots_per_entity: dict[str, list[str]],
+        associated_slots_per_entity: dict[str, list[int]],
         stake_info: StakeInfo,
         sender_address_lowercase: str,
-        access: dict[str, dict[str, list[str]]],
+        access: dict[str, dict[str, dict[int, int]]],
         is_init_code: bool,
     ) -> None:
         if entity_address in self.whitelist_entity_storage_access:
             return
 
         is_staked = ValidationManager.is_staked(stake_info)
+        entrypoint_lowercase = entrypoint.lower()
 
-        for contract_address in access.keys():
+        for contract_address, storage_slots in access.items():
             if contract_address == sender_address_lowercase:
                 continue  # allowed to access sender's storage
-            elif contract_address == entrypoint.lower():
+            elif contract_address == entrypoint_lowercase:
                 continue
 
-            storage_slots = access[contract_address]
-            slots = set(storage_slots["reads"]) | set(storage_slots["writes"])
+            # reads and writes are the accessed slots to their access count
+            reads = storage_slots["reads"]
+            writes = storage_slots["writes"]
+            if len(reads) == 0 and len(writes) == 0:
+                continue
+            slots = reads.keys() | writes.keys()
 
             for slot in slots:
                 require_stake_slot = None
@@ -394,7 +464,7 @@ class ValidationManager:
                                 ":",
                                 entity_address,
                                 "banned access to slot",
-                                slot,
+                                hex(slot),
                                 "at contract :",
                                 contract_address,
                             )
@@ -409,39 +479,43 @@ class ValidationManager:
                                 ":",
                                 entity_address,
                                 "insuffient stake to access",
-                                slot,
+                                hex(slot),
                                 "at contract :",
                                 contract_address,
                             )
                         ),
                     )
 
-    async def check_banned_op_codes(
+    def check_banned_op_codes(
         self,
         factory_opcodes: dict[str, int],
         account_opcodes: dict[str, int],
         paymaster_opcodes: dict[str, int],
     ) -> None:
-        await asyncio.gather(
-            self.verify_banned_opcodes(factory_opcodes, "factory", True),
-            self.verify_banned_opcodes(account_opcodes, "account"),
-            self.verify_banned_opcodes(paymaster_opcodes, "paymaster"),
-        )
+        self.verify_banned_opcodes(factory_opcodes, "factory", True)
+        self.verify_banned_opcodes(account_opcodes, "account")
+        self.verify_banned_opcodes(paymaster_opcodes, "paymaster")
 
     @staticmethod
     def format_debug_traceCall_data(debug_data: Any) -> DebugTraceCallData:
         factory_data = DebugEntityData(
-            debug_data["numberLevels"][0]["access"],
+            ValidationManager.format_entity_access(
+                debug_data["numberLevels"][0]["access"]
+            ),
             debug_data["numberLevels"][0]["opcodes"],
             debug_data["numberLevels"][0]["contractSize"],
         )
         account_data = DebugEntityData(
-            debug_data["numberLevels"][1]["access"],
+            ValidationManager.format_entity_access(
+                debug_data["numberLevels"][1]["access"]
+            ),
             debug_data["numberLevels"][1]["opcodes"],
             debug_data["numberLevels"][1]["contractSize"],
         )
         paymaster_data = DebugEntityData(
-            debug_data["numberLevels"][2]["access"],
+            ValidationManager.format_entity_access(
+                debug_data["numberLevels"][2]["access"]
+            ),
             debug_data["numberLevels"][2]["opcodes"],
             debug_data["numberLevels"][2]["contractSize"],
         )
@@ -458,7 +532,27 @@ class ValidationManager:
 
         return debug_trace_call_data
 
-    async def verify_banned_opcodes(
+    @staticmethod
+    def format_entity_access(
+        access: dict[str, dict[str, dict[str, int]]]
+    ) -> dict[str, dict[str, dict[int, int]]]:
+        # the tracer returns the slots as hex strings, they are parsed once
+        # here instead of on every storage access rule check
+        return {
+            contract_address: {
+                "reads": {
+                    int(slot, 16): count
+                    for slot, count in storage_slots["reads"].items()
+                },
+                "writes": {
+                    int(slot, 16): count
+                    for slot, count in storage_slots["writes"].items()
+                },
+            }
+            for contract_address, storage_slots in access.items()
+        }
+
+    def verify_banned_opcodes(
         self,
         opcodes: dict[str, int],
         opcode_source: str,
@@ -482,7 +576,7 @@ class ValidationManager:
                 )
 
     async def get_addresses_code_hash(self, addresses: list[str]) -> str:
-        call_data = encode(["address[]"], [addresses])
+        call_data = encode_addresses(addresses)
         params = [
             {
                 "from": self.bundler_address,
@@ -490,9 +584,7 @@ class ValidationManager:
             },
             "latest",
         ]
-        result: Any = await send_rpc_request_to_eth_client(
-            self.ethereum_node_url, "eth_call", params
-        )
+        result: Any = await self.rpc_client.send_rpc_request("eth_call", params)
         if "error" not in result:
             raise ValueError("BundlerHelper should revert")
 
@@ -510,7 +602,12 @@ class ValidationManager:
                 "Invalid UserOp signature or paymaster signature",
             )
 
-        if validUntil is None or validUntil < latest_block_timestamp + 30:
+        # compared to the latest block timestamp already fetched for the
+        # simulation, the bundle is sent within a few blocks
+        if (
+            validUntil is None
+            or validUntil < latest_block_timestamp + VALID_UNTIL_MIN_MARGIN
+        ):
             raise ValidationException(
                 ValidationExceptionCode.ExpiresShortly,
                 "Transaction will expire shortly or has expired.",
@@ -518,27 +615,19 @@ class ValidationManager:
 
     @staticmethod
     def is_slot_associated_with_address(
-        slot: str, address: str, associated_slots: list[str]
+        slot: int, address: str, associated_slots: list[int]
     ) -> bool:
-        address_lowercase = address[2:]  # .lower()
-        address_padded = "0x000000000000000000000000" + address_lowercase
-        address_lowercase = "0x" + address_lowercase
-
-        if slot == address_padded:
+        if slot == int(address, 16):
             return True
 
-        slot_int = int(slot, 16)
-
-        for associated_slot in associated_slots:
-            associated_slot_int = int(associated_slot, 16)
-            if (
-                    slot_int >= associated_slot_int
-                    and
-                    slot_int < associated_slot_int + 18
-            ):
-                return True
+        # associated_slots is sorted, the slot is associated if it is within
+        # ASSOCIATED_SLOT_RANGE slots of the closest associated slot before it
+        index = bisect.bisect_right(associated_slots, slot) - 1
 
-        return False
+        return (
+            index >= 0
+            and slot < associated_slots[index] + ASSOCIATED_SLOT_RANGE
+        )
 
     @staticmethod
     def is_staked(entity_stake: StakeInfo) -> bool:
@@ -550,22 +639,16 @@ class ValidationManager:
 
     @staticmethod
     def decode_validation_result(
-        solidity_error_params: str,
+        solidity_error_params: bytes,
     ) -> tuple[ReturnInfo, StakeInfo, StakeInfo, StakeInfo, bool]:
-        VALIDATION_RESULT_ABI = [
-            "(uint256,uint256,bool,uint64,uint64,bytes)",
-            "(uint256,uint256)",
-            "(uint256,uint256)",
-            "(uint256,uint256)",
-        ]
         try:
-            validation_result_decoded = decode(
-                VALIDATION_RESULT_ABI, bytes.fromhex(solidity_error_params)
+            validation_result_decoded = decode_validation_result_params(
+                solidity_error_params
             )
         except Exception:
             raise ValidationException(
                 ValidationExceptionCode.SimulateValidation,
-                str(bytes.fromhex(solidity_error_params)),
+                str(solidity_error_params),
             )
 
         return_info_arr = validation_result_decoded[0]
@@ -607,21 +690,24 @@ class ValidationManager:
     def parse_entity_slots(
             entities: list[str],
             keccak_list_unique: set[str]
-    ) -> dict[str, list[str]]:
-        entity_slots: dict[str, list[str]] = dict()
-        entities_addresses_padded_pair_list = map(
-            lambda address: (address, "0x000000000000000000000000" + address[2:]),
-            entities,
-        )
-
-        [
-            update_current_entity_slot(
-                slot_keccak, address, address_padded, entity_slots
-            )
-            for address, address_padded in entities_addresses_padded_pair_list
-            for slot_keccak in keccak_list_unique
-        ]
-        return entity_slots
+    ) -> dict[str, list[int]]:
+        entity_slots: dict[str, set[int]] = {
+            address: set() for address in entities
+        }
+        # the keccak preimage of a mapping slot starts with the padded key
+        addresses_padded_to_addresses = {
+            "0x000000000000000000000000" + address[2:]: address
+            for address in entities
+        }
+
+        for slot_keccak in keccak_list_unique:
+            address = addresses_padded_to_addresses.get(slot_keccak[:66])
+            if address is not None:
+                entity_slots[address].add(
+                    int.from_bytes(keccak(bytes.fromhex(slot_keccak[2:]))))
+
+        # sorted for is_slot_associated_with_address binary search
+        return {address: sorted(slots) for address, slots in entity_slots.items()}
 
     @staticmethod
     def parse_call_stack(
@@ -643,22 +729,26 @@ class ValidationManager:
 
                 return_data = call["data"]
 
-                result = Call()
-                result._to = top._to
-                result._from = top._from
-                result._type = top._type
-                result._gas = top._gas
-                result._gas_used = str(call.get("gasUsed"))
                 if top._type == "CREATE":
-                    result._data = "len=" + str(len(return_data))
-                elif top._type == "REVERT":
-                    result._method = top._method
-                    result._data = str(call.get("data"))
-                    result._return_type = "REVERT"
+                    result = Call(
+                        _to=top._to,
+                        _from=top._from,
+                        _type=top._type,
+                        _gas=top._gas,
+                        _data="len=" + str(len(return_data)),
+                        _gas_used=str(call.get("gasUsed")),
+                    )
                 else:
-                    result._method = top._method
-                    result._data = str(call.get("data"))
-                    result._return_type = "RETURN"
+                    result = Call(
+                        _to=top._to,
+                        _from=top._from,
+                        _type=top._type,
+                        _method=top._method,
+                        _gas=top._gas,
+                        _data=str(return_data),
+                        _gas_used=str(call.get("gasUsed")),
+                        _return_type=call["type"],
+                    )
 
                 if (
                     paymaster_address is not None
@@ -696,26 +786,10 @@ class ValidationManager:
             None,
         )
         if encodedInfo is not None:
-            decoded_result = decode(
-                ["bytes32", "bytes32", "uint256"],
-                bytes.fromhex(encodedInfo[10:]),
+            decoded_result = decode_validate_user_op_params(
+                bytes.fromhex(encodedInfo[10:])
             )
             user_operation_hash = "0x" + decoded_result[1].hex()
             return user_operation_hash
         else:
             raise ValueError("Failed get_user_operation_hash_from_debug_data")
-
-
-def update_current_entity_slot(
-        slot_keccak: str,
-        address: str,
-        address_padded: str,
-        entity_slots: dict[str, list[str]]) -> None:
-    if address not in entity_slots:
-        entity_slots[address] = []
-
-    current_entity_slot = entity_slots[address]
-    if address_padded in slot_keccak:
-        slot = keccak(bytes.fromhex(slot_keccak[2:])).hex()
-        if slot not in current_entity_slot:
-            current_entity_slot.append(slot)
@@ -13,8 +13,8 @@ from importlib.metadata import version
 import aiohttp
 
 from voltaire_bundler.bundler.mempool.mempool_info import DEFAULT_MEMPOOL_INFO
-from voltaire_bundler.utils.eth_client_utils import \
-    send_rpc_request_to_eth_client
+from voltaire_bundler.utils.eth_client_utils import (
+    DEFAULT_MAX_RPC_BATCH_SIZE, send_rpc_request_to_eth_client)
 
 from .typing import Address, MempoolId
 from .utils.import_key import (import_bundler_account,
@@ -77,6 +77,7 @@ class InitData:
     disable_p2p: bool
     max_verification_gas: int
     max_call_data_gas: int
+    max_rpc_batch_size: int
 
 
 def address(ep: str):
@@ -397,6 +398,18 @@ def initialize_argument_parser() -> ArgumentParser:
         default=30_000_000,
     )
 
+    parser.add_argument(
+        "--max_rpc_batch_size",
+        type=unsigned_int,
+        help=(
+            "Maximum number of requests per JSON-RPC batch sent to the Eth "
+            "Client - set to 1 to disable batching, defaults to 10"
+        ),
+        nargs="?",
+        const=DEFAULT_MAX_RPC_BATCH_SIZE,
+        default=DEFAULT_MAX_RPC_BATCH_SIZE,
+    )
+
     return parser
 
 
@@ -594,6 +607,7 @@ async def get_init_data(args: Namespace) -> InitData:
         args.disable_p2p,
         args.max_verification_gas,
         args.max_call_data_gas,
+        args.max_rpc_batch_size,
     )
 
     if args.verbose:
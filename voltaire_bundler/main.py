@@ -10,6 +10,7 @@ import uvloop
 from voltaire_bundler.bundler.execution_endpoint import ExecutionEndpoint
 from voltaire_bundler.metrics.metrics import run_metrics_server
 from voltaire_bundler.p2p_boot import p2p_boot
+from voltaire_bundler.utils.eth_client_utils import close_client_session
 from voltaire_bundler.utils.SignalHaltError import immediate_exit
 
 from .cli_manager import get_init_data, initialize_argument_parser
@@ -47,42 +48,46 @@ async def main(cmd_args=sys.argv[1:], loop=None) -> None:
 
     asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
 
-    async with asyncio.TaskGroup() as task_group:
-        execution_endpoint: ExecutionEndpoint = ExecutionEndpoint(
-            init_data.ethereum_node_url,
-            init_data.bundler_pk,
-            init_data.bundler_address,
-            init_data.entrypoints,
-            init_data.bundler_helper_byte_code,
-            init_data.entrypoint_mod_byte_code,
-            init_data.chain_id,
-            init_data.is_unsafe,
-            init_data.is_legacy_mode,
-            init_data.is_send_raw_transaction_conditional,
-            init_data.bundle_interval,
-            init_data.whitelist_entity_storage_access,
-            init_data.max_fee_per_gas_percentage_multiplier,
-            init_data.max_priority_fee_per_gas_percentage_multiplier,
-            init_data.enforce_gas_price_tolerance,
-            init_data.ethereum_node_debug_trace_call_url,
-            init_data.entrypoints_versions,
-            init_data.p2p_mempools_types,
-            init_data.p2p_mempools_ids,
-            init_data.disable_p2p,
-            init_data.max_verification_gas,
-            init_data.max_call_data_gas,
-        )
-        task_group.create_task(execution_endpoint.start_execution_endpoint())
-
-        task_group.create_task(
-            run_rpc_http_server(
-                host=init_data.rpc_url,
-                rpc_cors_domain=init_data.rpc_cors_domain,
-                port=init_data.rpc_port,
-                is_debug=init_data.is_debug,
+    try:
+        async with asyncio.TaskGroup() as task_group:
+            execution_endpoint: ExecutionEndpoint = ExecutionEndpoint(
+                init_data.ethereum_node_url,
+                init_data.bundler_pk,
+                init_data.bundler_address,
+                init_data.entrypoints,
+                init_data.bundler_helper_byte_code,
+                init_data.entrypoint_mod_byte_code,
+                init_data.chain_id,
+                init_data.is_unsafe,
+                init_data.is_legacy_mode,
+                init_data.is_send_raw_transaction_conditional,
+                init_data.bundle_interval,
+                init_data.whitelist_entity_storage_access,
+                init_data.max_fee_per_gas_percentage_multiplier,
+                init_data.max_priority_fee_per_gas_percentage_multiplier,
+                init_data.enforce_gas_price_tolerance,
+                init_data.ethereum_node_debug_trace_call_url,
+                init_data.entrypoints_versions,
+                init_data.p2p_mempools_types,
+                init_data.p2p_mempools_ids,
+                init_data.disable_p2p,
+                init_data.max_verification_gas,
+                init_data.max_call_data_gas,
+                init_data.max_rpc_batch_size,
             )
-        )
-        if init_data.is_metrics:
-            run_metrics_server(
-                host=init_data.rpc_url,
+            task_group.create_task(execution_endpoint.start_execution_endpoint())
+
+            task_group.create_task(
+                run_rpc_http_server(
+                    host=init_data.rpc_url,
+                    rpc_cors_domain=init_data.rpc_cors_domain,
+                    port=init_data.rpc_port,
+                    is_debug=init_data.is_debug,
+                )
             )
+            if init_data.is_metrics:
+                run_metrics_server(
+                    host=init_data.rpc_url,
+                )
+    finally:
+        await close_client_session()
@@ -50,7 +50,7 @@ async def _handle_rpc_request(
     }
     resp = await rpcClient.request(requestEvent)
 
-    logging.debug(f"{request_type} RPC served")
+    logging.debug("%s RPC served", request_type)
 
     if resp is not None and "is_error" in resp and resp["is_error"]:
         error: ValidationException | ExecutionException = resp["payload"]
@@ -1,7 +1,7 @@
 from dataclasses import dataclass
 
 
-@dataclass
+@dataclass(slots=True)
 class ReturnInfo:
     # SELECTOR = "0xf04297e9"
     preOpGas: int
@@ -12,7 +12,7 @@ class ReturnInfo:
     paymasterContext: bytes
 
 
-@dataclass
+@dataclass(slots=True)
 class StakeInfo:
     stake: int
     unstakeDelaySec: int
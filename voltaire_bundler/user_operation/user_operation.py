@@ -1,12 +1,31 @@
 import re
 from dataclasses import InitVar, dataclass
+from dataclasses import field as dataclass_field
+from typing import Any
 
 from voltaire_bundler.bundler.exceptions import (ValidationException,
                                                  ValidationExceptionCode)
 from voltaire_bundler.typing import Address, MempoolId
 
+# the fields returned by UserOperation.to_list()
+USER_OPERATION_LIST_FIELDS = frozenset(
+    (
+        "sender_address",
+        "nonce",
+        "init_code",
+        "call_data",
+        "call_gas_limit",
+        "verification_gas_limit",
+        "pre_verification_gas",
+        "max_fee_per_gas",
+        "max_priority_fee_per_gas",
+        "paymaster_and_data",
+        "signature",
+    )
+)
+
 
-@dataclass()
+@dataclass(slots=True)
 class UserOperation:
     sender_address: Address
     nonce: int
@@ -25,9 +44,13 @@ class UserOperation:
     paymaster_address_lowercase: Address | None
     valid_mempools_ids: list[MempoolId]
     user_operation_hash: str
+    _to_list_cache: tuple[Address | str | int | bytes, ...] | None = dataclass_field(
+        repr=False, compare=False
+    )
     jsonRequestDict: InitVar[dict[str, Address | int | bytes]]
 
     def __init__(self, jsonRequestDict) -> None:
+        self._to_list_cache = None
         if len(jsonRequestDict) != 11:
             raise ValidationException(
                 ValidationExceptionCode.InvalidFields,
@@ -122,8 +145,17 @@ class UserOperation:
             "signature": "0x" + self.signature.hex(),
         }
 
-    def to_list(self) -> list[Address | str | int | bytes]:
-        return [
+    def __setattr__(self, name: str, value: Any) -> None:
+        object.__setattr__(self, name, value)
+        # the gas limits are updated after estimation
+        if name in USER_OPERATION_LIST_FIELDS:
+            object.__setattr__(self, "_to_list_cache", None)
+
+    def to_list(self) -> tuple[Address | str | int | bytes, ...]:
+        if self._to_list_cache is not None:
+            return self._to_list_cache
+
+        self._to_list_cache = (
             self.sender_address,
             self.nonce,
             self.init_code,
@@ -135,7 +167,8 @@ class UserOperation:
             self.max_priority_fee_per_gas,
             self.paymaster_and_data,
             self.signature,
-        ]
+        )
+        return self._to_list_cache
 
     def _set_factory_and_paymaster_address(self) -> None:
         if len(self.init_code) > 20:
@@ -1,14 +1,37 @@
 from functools import cache
+from typing import Any, Callable
 
 from eth_abi import decode
+from eth_abi.decoding import ContextFramesBytesIO, TupleDecoder
+from eth_abi.registry import registry
 
+FAILED_OP_PARAMS_API = ["uint256", "string"]
 
-@cache
-def decode_FailedOp_event(solidity_error_params: str) -> tuple[int, str]:
-    FAILED_OP_PARAMS_API = ["uint256", "string"]
-    failed_op_params_res = decode(
-        FAILED_OP_PARAMS_API, bytes.fromhex(solidity_error_params)
+
+def abi_decoder(types: list[str]) -> Callable[[bytes], tuple[Any, ...]]:
+    # same as decode(types, data) but the types decoders are resolved once
+    # instead of on every call
+    tuple_decoder = TupleDecoder(  # type: ignore[no-untyped-call]
+        decoders=[registry.get_decoder(type_str) for type_str in types]
     )
+
+    def decode_abi(data: bytes) -> tuple[Any, ...]:
+        stream = ContextFramesBytesIO(data)  # type: ignore[no-untyped-call]
+        return tuple_decoder(stream)
+
+    return decode_abi
+
+
+decode_FailedOp_params = abi_decoder(FAILED_OP_PARAMS_API)
+
+
+@cache
+def decode_FailedOp_event(
+    solidity_error_params: str | bytes,
+) -> tuple[int, str]:
+    if isinstance(solidity_error_params, str):
+        solidity_error_params = bytes.fromhex(solidity_error_params)
+    failed_op_params_res = decode_FailedOp_params(solidity_error_params)
     operation_index = failed_op_params_res[0]
     reason = failed_op_params_res[1]
 
@@ -1,45 +1,152 @@
 from eth_abi import encode
+from functools import lru_cache
 from typing import Any
 
 from voltaire_bundler.user_operation.user_operation import UserOperation
 
+HANDLE_OPS_SELECTOR = bytes.fromhex("1fad948c")
+# indexes of the dynamic bytes fields in UserOperation.to_list()
+# initCode, callData, paymasterAndData and signature
+USER_OPERATION_BYTES_FIELDS = (2, 3, 9, 10)
+USER_OPERATION_HEAD_SIZE = 11 * 32
+SIMULATE_VALIDATION_PARAMS_HEAD = (32).to_bytes(32, "big")
+ADDRESSES_PARAMS_HEAD = (32).to_bytes(32, "big")
+ADDRESS_PADDING = bytes(12)
+SIMULATE_VALIDATION_CALLDATA_CACHE_SIZE = 1024
+
 
 def encode_handleops_calldata(
-        user_operations_list: list[list[Any]], bundler_address: str) -> str:
-    function_selector = "0x1fad948c"  # handleOps
-    params = encode(
+        user_operations_list: list[tuple[Any, ...]],
+        bundler_address: str) -> bytes:
+    params = encode_user_operations(user_operations_list, bundler_address)
+
+    # kept as bytes, it is only hex encoded when sent to the node
+    call_data = HANDLE_OPS_SELECTOR + params
+    return call_data
+
+
+def encode_handleops_calldata_from_encoded_user_operations(
+        encoded_user_operations: list[bytes],
+        bundler_address: str) -> bytes:
+    # same as encode_handleops_calldata but from user operations already
+    # encoded with encode_user_operation, so that a bundle can be encoded
+    # again after dropping a user operation without encoding the others
+    return HANDLE_OPS_SELECTOR + _encode_handleops_params(
+        encoded_user_operations, bundler_address)
+
+
+def encode_user_operations(
+        user_operations_list: list[tuple[Any, ...]],
+        beneficiary: str) -> bytes:
+    # abi encodes the handleOps (UserOperation[], address) params for the
+    # fixed UserOperation schema, the same output as
+    # encode(["(address,uint256,bytes,...)[]", "address"], [...])
+    # but computing all the head/tail offsets upfront
+    return _encode_handleops_params(
         [
-            "(address,uint256,bytes,bytes,uint256,uint256,uint256,uint256,uint256,bytes,bytes)[]",
-            "address",
+            encode_user_operation(user_operation)
+            for user_operation in user_operations_list
         ],
-        [user_operations_list, bundler_address],
+        beneficiary,
     )
 
-    call_data = function_selector + params.hex()
-    return call_data
+
+def encode_user_operation(user_operation: tuple[Any, ...]) -> bytes:
+    # abi encodes a single UserOperation tuple into a preallocated buffer
+    user_operation_size = USER_OPERATION_HEAD_SIZE
+    for field_index in USER_OPERATION_BYTES_FIELDS:
+        user_operation_size += 32 + _padded_length(
+            len(user_operation[field_index]))
+
+    buffer = bytearray(user_operation_size)
+    _write_user_operation(buffer, 0, user_operation)
+    return bytes(buffer)
+
+
+def _encode_handleops_params(
+        encoded_user_operations: list[bytes], beneficiary: str) -> bytes:
+    # head: offset of the array and the beneficiary address
+    # array: length, the offsets of every user operation then their encoding
+    number_of_user_operations = len(encoded_user_operations)
+    array_start = 64
+    buffer = bytearray(array_start + 32 + 32 * number_of_user_operations)
+
+    buffer[0:32] = array_start.to_bytes(32, "big")
+    buffer[44:64] = bytes.fromhex(beneficiary[2:])
+    buffer[64:96] = number_of_user_operations.to_bytes(32, "big")
+
+    offset = 32 * number_of_user_operations
+    for index, encoded_user_operation in enumerate(encoded_user_operations):
+        offset_position = array_start + 32 + 32 * index
+        buffer[offset_position: offset_position + 32] = offset.to_bytes(
+            32, "big")
+        offset += len(encoded_user_operation)
+
+    return bytes(buffer) + b"".join(encoded_user_operations)
+
+
+def _write_user_operation(
+        buffer: bytearray, start: int, user_operation: tuple[Any, ...]) -> None:
+    tail_offset = USER_OPERATION_HEAD_SIZE
+    for field_index, value in enumerate(user_operation):
+        head_position = start + 32 * field_index
+        if field_index == 0:  # sender address
+            buffer[head_position + 12: head_position + 32] = bytes.fromhex(
+                value[2:])
+        elif field_index in USER_OPERATION_BYTES_FIELDS:
+            buffer[head_position: head_position + 32] = tail_offset.to_bytes(
+                32, "big")
+            tail_position = start + tail_offset
+            value_length = len(value)
+            buffer[tail_position: tail_position + 32] = value_length.to_bytes(
+                32, "big")
+            buffer[tail_position + 32: tail_position + 32 + value_length] = value
+            tail_offset += 32 + _padded_length(value_length)
+        else:  # uint256
+            buffer[head_position: head_position + 32] = value.to_bytes(
+                32, "big")
+
+
+def _padded_length(length: int) -> int:
+    return (length + 31) // 32 * 32
 
 
 def encode_simulate_validation_calldata(user_operation: UserOperation) -> str:
     # simulateValidation(entrypoint solidity function) will always revert
+    return _encode_simulate_validation_calldata(user_operation.to_list())
+
+
+@lru_cache(maxsize=SIMULATE_VALIDATION_CALLDATA_CACHE_SIZE)
+def _encode_simulate_validation_calldata(
+        user_operation_list: tuple[Any, ...]) -> str:
+    # cached as a user operation is simulated more than once, it is keyed on
+    # the user operation fields so an updated user operation is encoded again
     function_selector = "0xee219423"
-    params = encode(
-        [
-            "(address,uint256,bytes,bytes,uint256,uint256,uint256,uint256,uint256,bytes,bytes)"
-        ],
-        [user_operation.to_list()],
-    )
+    # the offset of the UserOperation tuple then its encoding
+    params = SIMULATE_VALIDATION_PARAMS_HEAD + encode_user_operation(
+        user_operation_list)
+    return function_selector + params.hex()
 
-    call_data = function_selector + params.hex()
-    return call_data
+
+def encode_addresses(addresses: list[str]) -> bytes:
+    # abi encodes an address[], the same output as encode(["address[]"], ...)
+    # the offset of the array, its length then every address left padded
+    return (
+        ADDRESSES_PARAMS_HEAD
+        + len(addresses).to_bytes(32, "big")
+        + b"".join(
+            ADDRESS_PADDING + bytes.fromhex(address[2:]) for address in addresses
+        )
+    )
 
 
 def encode_gasEstimateL1Component_calldata(
-    entrypoint: str, is_init: bool, handleops_calldata: str
+    entrypoint: str, is_init: bool, handleops_calldata: bytes
 ) -> str:
     function_selector = "0x77d488a2"  # gasEstimateL1Component
     params = encode(
         ["address", "bool", "bytes"],  # to  # contractCreation  # data
-        [entrypoint, is_init, bytes.fromhex(handleops_calldata[2:])],
+        [entrypoint, is_init, handleops_calldata],
     )
 
     call_data = function_selector + params.hex()
@@ -1,30 +1,255 @@
+import asyncio
+import itertools
 import json
+import re
 from dataclasses import dataclass
 from typing import Any
 
-from aiohttp import ClientSession
+import orjson
+from aiohttp import ClientSession, TCPConnector
+
+DEFAULT_MAX_RPC_BATCH_SIZE = 10
+DEFAULT_RPC_BATCH_WINDOW = 0.0  # seconds
+CONNECTION_POOL_LIMIT = 32
+KEEPALIVE_TIMEOUT = 75  # seconds
+
+_client_session: ClientSession | None = None
+_client_session_loop: asyncio.AbstractEventLoop | None = None
+_rpc_request_ids = itertools.count(1)
+# a json number with 20 digits or more, 2**64 has 20 digits
+BIG_JSON_INT_PATTERN = re.compile(rb"[:,\[]\s*-?[0-9]{20}")
+
+
+def json_dumps(obj: Any) -> bytes:
+    try:
+        return orjson.dumps(obj)
+    except orjson.JSONEncodeError:  # ints bigger than 64 bits
+        return json.dumps(obj).encode()
+
+
+def json_loads(data: bytes) -> Any:
+    # orjson silently turns ints bigger than 64 bits into floats, so the
+    # stdlib json is used for the responses that may contain them
+    if BIG_JSON_INT_PATTERN.search(data) is None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def get_client_session() -> ClientSession:
+    # a single session is shared by all requests so that connections to the
+    # eth client are kept alive and reused instead of doing a new TCP/TLS
+    # handshake for every request
+    global _client_session, _client_session_loop
+    loop = asyncio.get_running_loop()
+    if (
+        _client_session is None
+        or _client_session.closed
+        or _client_session_loop is not loop
+    ):
+        _client_session = ClientSession(
+            connector=TCPConnector(
+                limit=CONNECTION_POOL_LIMIT,
+                keepalive_timeout=KEEPALIVE_TIMEOUT,
+            )
+        )
+        _client_session_loop = loop
+    return _client_session
+
+
+async def close_client_session() -> None:
+    global _client_session, _client_session_loop
+    if _client_session is not None and not _client_session.closed:
+        await _client_session.close()
+    _client_session = None
+    _client_session_loop = None
 
 
 async def send_rpc_request_to_eth_client(
-    ethereum_node_url, method, params=None
+    ethereum_node_url: str,
+    method: str,
+    params: Any = None,
+    session: ClientSession | None = None,
 ) -> Any:
     json_request = {
         "jsonrpc": "2.0",
-        "id": 1,
+        "id": next(_rpc_request_ids),
         "method": method,
         "params": params,
     }
 
     if params is not None:
         json_request["params"] = params
-    async with ClientSession() as session:
-        async with session.post(
-            ethereum_node_url,
-            data=json.dumps(json_request),
-            headers={"content-type": "application/json"},
-        ) as response:
-            resp = await response.read()
-            return json.loads(resp)
+    if session is None:
+        session = get_client_session()
+    async with session.post(
+        ethereum_node_url,
+        data=json_dumps(json_request),
+        headers={"content-type": "application/json"},
+    ) as response:
+        resp = await response.read()
+        return json_loads(resp)
+
+
+async def send_rpc_batch_request_to_eth_client(
+    ethereum_node_url: str,
+    requests: list[tuple[str, Any]],
+    max_batch_size: int = DEFAULT_MAX_RPC_BATCH_SIZE,
+    session: ClientSession | None = None,
+) -> list[Any]:
+    # sends the (method, params) requests as JSON-RPC batches of at most
+    # max_batch_size entries and returns the responses in the requests order.
+    # a max_batch_size of 1 or less sends every request on its own
+    if session is None:
+        session = get_client_session()
+
+    if max_batch_size <= 1:
+        return await _send_rpc_requests_one_by_one(
+            ethereum_node_url, requests, session)
+
+    batches = [
+        requests[start: start + max_batch_size]
+        for start in range(0, len(requests), max_batch_size)
+    ]
+    batches_responses = await asyncio.gather(
+        *[_send_rpc_batch(ethereum_node_url, batch, session) for batch in batches]
+    )
+    return [
+        response
+        for batch_responses in batches_responses
+        for response in batch_responses
+    ]
+
+
+async def _send_rpc_batch(
+    ethereum_node_url: str, requests: list[tuple[str, Any]], session: ClientSession
+) -> list[Any]:
+    json_requests = []
+    for method, params in requests:
+        json_request = {
+            "jsonrpc": "2.0",
+            "id": next(_rpc_request_ids),
+            "method": method,
+        }
+        if params is not None:
+            json_request["params"] = params
+        json_requests.append(json_request)
+
+    async with session.post(
+        ethereum_node_url,
+        data=json_dumps(json_requests),
+        headers={"content-type": "application/json"},
+    ) as response:
+        resp = await response.read()
+        responses = json_loads(resp)
+
+    # some providers don't support batching and reply with a single error
+    if not isinstance(responses, list) or len(responses) != len(requests):
+        return await _send_rpc_requests_one_by_one(
+            ethereum_node_url, requests, session)
+
+    # batch responses can be returned in any order
+    ids_to_responses = {response.get("id"): response for response in responses}
+    if any(
+        json_request["id"] not in ids_to_responses
+        for json_request in json_requests
+    ):
+        return await _send_rpc_requests_one_by_one(
+            ethereum_node_url, requests, session)
+
+    return [
+        ids_to_responses[json_request["id"]] for json_request in json_requests
+    ]
+
+
+async def _send_rpc_requests_one_by_one(
+    ethereum_node_url: str, requests: list[tuple[str, Any]], session: ClientSession
+) -> list[Any]:
+    return list(
+        await asyncio.gather(
+            *[
+                send_rpc_request_to_eth_client(
+                    ethereum_node_url, method, params, session)
+                for method, params in requests
+            ]
+        )
+    )
+
+
+class BatchingRpcClient:
+    # coalesces the requests sent within batch_window seconds into JSON-RPC
+    # batches of at most max_batch_size requests. a batch_window of 0 only
+    # coalesces the requests sent in the same event loop iteration, like the
+    # gathered ones, so a lone request isn't delayed. a max_batch_size of 1
+    # or less sends every request on its own
+    ethereum_node_url: str
+    max_batch_size: int
+    batch_window: float
+    pending_requests: list[tuple[str, Any, asyncio.Future[Any]]]
+    flush_handle: asyncio.Handle | None
+    batches_tasks: set[asyncio.Task[None]]
+
+    def __init__(
+        self,
+        ethereum_node_url: str,
+        max_batch_size: int = DEFAULT_MAX_RPC_BATCH_SIZE,
+        batch_window: float = DEFAULT_RPC_BATCH_WINDOW,
+    ):
+        self.ethereum_node_url = ethereum_node_url
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window
+        self.pending_requests = []
+        self.flush_handle = None
+        self.batches_tasks = set()
+
+    async def send_rpc_request(self, method: str, params: Any = None) -> Any:
+        if self.max_batch_size <= 1:
+            return await send_rpc_request_to_eth_client(
+                self.ethereum_node_url, method, params)
+
+        future = asyncio.get_running_loop().create_future()
+        self.pending_requests.append((method, params, future))
+        if len(self.pending_requests) >= self.max_batch_size:
+            self.flush()
+        elif self.flush_handle is None:
+            loop = asyncio.get_running_loop()
+            if self.batch_window > 0:
+                self.flush_handle = loop.call_later(self.batch_window, self.flush)
+            else:
+                self.flush_handle = loop.call_soon(self.flush)
+        return await future
+
+    def flush(self) -> None:
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+
+        pending_requests = self.pending_requests
+        self.pending_requests = []
+        if len(pending_requests) > 0:
+            # a reference to the task is kept until it is done so that it
+            # doesn't get garbage collected
+            batch_task = asyncio.create_task(self._send_batch(pending_requests))
+            self.batches_tasks.add(batch_task)
+            batch_task.add_done_callback(self.batches_tasks.discard)
+
+    async def _send_batch(
+        self, pending_requests: list[tuple[str, Any, asyncio.Future[Any]]]
+    ) -> None:
+        try:
+            responses = await send_rpc_batch_request_to_eth_client(
+                self.ethereum_node_url,
+                [(method, params) for method, params, _ in pending_requests],
+                self.max_batch_size,
+            )
+        except Exception as excp:
+            for _, _, future in pending_requests:
+                if not future.done():
+                    future.set_exception(excp)
+            return
+
+        for (_, _, future), response in zip(pending_requests, responses):
+            if not future.done():  # the caller can be cancelled
+                future.set_result(response)
 
 
 async def get_latest_block_info(
@@ -56,7 +281,7 @@ async def get_latest_block_info(
 
 @dataclass
 class DebugEntityData:
-    access: dict[str, dict[str, list[str]]]
+    access: dict[str, dict[str, dict[int, int]]]
     opcodes: dict[str, int]
     contract_size: dict[str, int]
 
@@ -72,7 +297,7 @@ class DebugTraceCallData:
     debug: list
 
 
-@dataclass
+@dataclass(slots=True)
 class Call:
     _to: str = ""
     _from: str = ""